@@ -7,10 +7,16 @@ from dotenv import load_dotenv
 load_dotenv()  # 自动读取项目根目录的 .env
 
 import os
+import time
 import argparse
+import hashlib
+import sqlite3
+import functools
 from openai import OpenAI
 
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # change if you prefer another chat model
+DEFAULT_TEMPERATURE = 0.0  # deterministic output; also what makes responses cacheable
+CACHE_PATH = os.path.expanduser("~/.cache/text2sql.db")
 
 SYSTEM_PROMPT = """You are a precise Text-to-SQL generator.
 - Input: (1) SQL dialect, (2) database schema (CREATE TABLE ...), (3) a natural-language question.
@@ -21,36 +27,80 @@ SYSTEM_PROMPT = """You are a precise Text-to-SQL generator.
 - If aggregation or filtering is ambiguous, choose the most reasonable interpretation.
 """
 
-USER_TEMPLATE = """SQL Dialect: {dialect}
+# Static context (instructions + dialect + schema) goes first and the question last, so
+# repeated calls against one schema share a byte-identical prefix that OpenAI's
+# automatic prompt cache can reuse.
+CONTEXT_TEMPLATE = """{system_prompt}
+SQL Dialect: {dialect}
 
 SCHEMA:
 {schema}
+"""
 
-QUESTION:
-{question}
+USER_PREFIX = "QUESTION:\n"
+USER_SUFFIX = "\n\nReturn ONLY the SQL query, nothing else.\n"
 
-Return ONLY the SQL query, nothing else.
-"""
+@functools.lru_cache(maxsize=4)
+def prebuilt_context(schema_text: str, dialect: str):
+    # Built once per (schema, dialect): the formatted system message and the schema hash
+    context_msg = CONTEXT_TEMPLATE.format(system_prompt=SYSTEM_PROMPT, dialect=dialect, schema=schema_text.strip())
+    schema_hash = hashlib.sha256(schema_text.encode()).hexdigest()
+    return context_msg, schema_hash
+
+_client = None
+
+def get_client() -> OpenAI:
+    # One client per process so its HTTP connection pool is reused across calls
+    global _client
+    if _client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("Please set the OPENAI_API_KEY environment variable.")
+        _client = OpenAI(api_key=api_key)
+    return _client
 
-def generate_sql(schema_text: str, question: str, dialect: str = "ANSI SQL", model: str = DEFAULT_MODEL, temperature: float = 0.1) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("Please set the OPENAI_API_KEY environment variable.")
+_cache = None
 
-    client = OpenAI(api_key=api_key)
+def get_cache() -> sqlite3.Connection:
+    # Persistent response cache, opened on first use
+    global _cache
+    if _cache is None:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        _cache = sqlite3.connect(CACHE_PATH)
+        _cache.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, sql TEXT, ts INTEGER)")
+    return _cache
 
-    user_msg = USER_TEMPLATE.format(dialect=dialect, schema=schema_text.strip(), question=question.strip())
+def generate_sql(schema_text: str, question: str, dialect: str = "ANSI SQL", model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE, use_cache: bool = True) -> str:
+    context_msg, schema_hash = prebuilt_context(schema_text, dialect)
+    # Sampled output is not reproducible, so only deterministic calls are cached
+    use_cache = use_cache and temperature == 0
+    if use_cache:
+        response_key = hashlib.sha256(f"{model}|{dialect}|{schema_hash}|{question.strip()}".encode()).hexdigest()
+        row = get_cache().execute("SELECT sql FROM responses WHERE key = ?", (response_key,)).fetchone()
+        if row:
+            return row[0]
+
+    client = get_client()
+
+    user_msg = USER_PREFIX + question.strip() + USER_SUFFIX
+    # Route calls for the same schema to the same cache shard
+    cache_key = schema_hash[:16]
 
     resp = client.chat.completions.create(
         model=model,
         temperature=temperature,
         messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": context_msg},
             {"role": "user", "content": user_msg}
-        ]
+        ],
+        extra_body={"prompt_cache_key": cache_key}
     )
     # Extract the assistant's message text
     sql = resp.choices[0].message.content.strip()
+
+    if use_cache:
+        with get_cache() as cache:
+            cache.execute("INSERT OR REPLACE INTO responses (key, sql, ts) VALUES (?, ?, ?)", (response_key, sql, int(time.time())))
     return sql
 
 def main():
@@ -61,7 +111,8 @@ def main():
     parser.add_argument("--question", required=True, type=str, help="Natural-language question about the data")
     parser.add_argument("--dialect", default="ANSI SQL", help="SQL dialect hint (e.g., 'PostgreSQL', 'SQLite', 'MySQL')")
     parser.add_argument("--model", default=DEFAULT_MODEL, help="OpenAI chat model (defaults to env OPENAI_MODEL or gpt-4o-mini)")
-    parser.add_argument("--temperature", default=0.1, type=float, help="Sampling temperature (lower = more deterministic)")
+    parser.add_argument("--temperature", default=DEFAULT_TEMPERATURE, type=float, help="Sampling temperature (lower = more deterministic; only 0 is cached)")
+    parser.add_argument("--no-cache", action="store_true", help=f"Bypass the local response cache at {CACHE_PATH}")
     args = parser.parse_args()
 
     if args.schema:
@@ -70,7 +121,7 @@ def main():
     else:
         schema_text = args.schema_text
 
-    sql = generate_sql(schema_text=schema_text, question=args.question, dialect=args.dialect, model=args.model, temperature=args.temperature)
+    sql = generate_sql(schema_text=schema_text, question=args.question, dialect=args.dialect, model=args.model, temperature=args.temperature, use_cache=not args.no_cache)
     print(sql)
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ Simple demonstration of the system's capabilities
 
 import os
 import sys
+import sqlite3
 from pathlib import Path
 
 # Add project modules to path
@@ -58,16 +59,27 @@ def demo_text_to_sql():
     try:
         # Get basic stats
         conn = converter.get_db_connection()
-        cursor = conn.execute("SELECT COUNT(*) as block_count FROM blocks")
-        block_count = cursor.fetchone()['block_count']
-        
-        cursor = conn.execute("SELECT COUNT(*) as tx_count FROM transactions")
-        tx_count = cursor.fetchone()['tx_count']
+        try:
+            # Row counts maintained by the ETL, read in one query
+            row = conn.execute("""
+                SELECT (SELECT n FROM counts WHERE name = 'blocks') as block_count,
+                       (SELECT n FROM counts WHERE name = 'transactions') as tx_count,
+                       (SELECT MAX(height) FROM blocks) as latest_height
+            """).fetchone()
+        except sqlite3.OperationalError:
+            row = None
         
-        cursor = conn.execute("SELECT MAX(height) as latest_height FROM blocks")
-        latest_height = cursor.fetchone()['latest_height']
+        if row is None or row['block_count'] is None or row['tx_count'] is None:
+            # Database predates the counts table; fall back to counting
+            row = conn.execute("""
+                SELECT (SELECT COUNT(*) FROM blocks) as block_count,
+                       (SELECT COUNT(*) FROM transactions) as tx_count,
+                       (SELECT MAX(height) FROM blocks) as latest_height
+            """).fetchone()
         
-        conn.close()
+        block_count = row['block_count']
+        tx_count = row['tx_count']
+        latest_height = row['latest_height']
         
         print(f"  Total blocks: {block_count:,}")
         print(f"  Total transactions: {tx_count:,}")
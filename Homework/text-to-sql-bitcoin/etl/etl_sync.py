@@ -5,15 +5,26 @@ Fetches blocks from bitcoind and writes to SQLite database
 Supports checkpointing and reorg handling
 """
 
-import json
+import orjson
 import sqlite3
 import time
+import zlib
 import logging
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 import os
 
+try:
+    import httpx
+except ImportError:  # Only needed for --async
+    httpx = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,26 +36,261 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of heights resolved per JSON-RPC batch. Verbose blocks are several MB of
+# JSON each, so this is kept modest to bound memory per round-trip.
+RPC_BATCH_SIZE = 16
+
+# Batches fetched concurrently ahead of the single SQLite writer. Kept at or below
+# bitcoind's -rpcthreads, and small enough that in-flight blocks fit in memory.
+FETCH_WORKERS = 4
+
+# Batches in flight at once on the asyncio fetch path (sync_blocks_async); also the
+# HTTP connection limit. bitcoind queues up to -rpcworkqueue requests beyond its
+# -rpcthreads, so going much higher only earns "work queue depth exceeded" errors.
+ASYNC_FETCH_WINDOW = 16
+
+# Retry policy when bitcoind pushes back (HTTP 429/503, "Work queue depth exceeded"):
+# exponential backoff of 1, 2, 4, 8, 8... seconds, at most RPC_MAX_ATTEMPTS tries
+RPC_MAX_ATTEMPTS = 5
+RPC_MAX_BACKOFF = 8
+RPC_OVERLOAD_STATUSES = (429, 503)
+
+# How far below the new tip handle_reorg searches for the fork point
+REORG_SEARCH_DEPTH = 100
+
+# PRAGMA user_version set by ../sql/schema.sql. Version 2 stores hashes as raw
+# BLOBs; an older database would end up with TEXT and BLOB hashes mixed together
+SCHEMA_VERSION = 2
+
+# Applied to every connection: WAL lets readers (demo, reorg checker) run alongside
+# the writer, and synchronous=NORMAL drops the fsync on every commit.
+SQLITE_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-262144;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA foreign_keys=OFF;
+"""
+
+INSERT_BLOCK_SQL = """
+    INSERT OR IGNORE INTO blocks (
+        hash, confirmations, size, weight, height, version, versionHex,
+        merkleroot, tx, time, mediantime, nonce, bits, difficulty,
+        chainwork, nTx, previousblockhash, nextblockhash, strippedsize,
+        sigops, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_TRANSACTION_SQL = """
+    INSERT OR IGNORE INTO transactions (
+        txid, hash, version, size, vsize, weight, locktime,
+        block_hash, block_height, block_time, confirmations,
+        time, blocktime, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPDATE_COUNT_SQL = "UPDATE counts SET n = n + ? WHERE name = ?"
+
+INSERT_INPUT_SQL = """
+    INSERT INTO tx_inputs (
+        txid, vout, sequence, coinbase, txinwitness,
+        prevout_hash, prevout_n, scriptsig, scriptsig_asm,
+        inner_witnessscript_asm, inner_redeemscript_asm
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_OUTPUT_SQL = """
+    INSERT INTO tx_outputs (
+        txid, n, scriptPubKey, scriptPubKey_asm, scriptPubKey_type,
+        scriptPubKey_addresses, value
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+def rpc_request(method: str, params: Optional[List], request_id) -> Dict:
+    """Build one JSON-RPC request object for bitcoind"""
+    return {
+        "jsonrpc": "1.0",
+        "id": request_id,
+        "method": method,
+        "params": params or []
+    }
+
+def rpc_batch_payload(calls: List[Tuple[str, List]]) -> List[Dict]:
+    """Build a JSON-RPC batch; each request's id is its position in calls"""
+    return [rpc_request(method, params, i) for i, (method, params) in enumerate(calls)]
+
+def rpc_batch_results(calls: List[Tuple[str, List]], response: List[Dict]) -> List:
+    """Results of a JSON-RPC batch in call order, raising on the first call that failed"""
+    results = sorted(response, key=lambda r: r['id'])
+    
+    for (method, params), result in zip(calls, results):
+        if result.get('error') is not None:
+            raise Exception(f"RPC Error for {method} {params}: {result['error']}")
+    
+    return [result['result'] for result in results]
+
+def rpc_retry_delay(attempt: int, status_code: int) -> Optional[int]:
+    """Seconds to back off before retrying a response, or None if it is final"""
+    if status_code not in RPC_OVERLOAD_STATUSES or attempt == RPC_MAX_ATTEMPTS - 1:
+        return None
+    delay = min(2 ** attempt, RPC_MAX_BACKOFF)
+    logger.warning(f"bitcoind overloaded (HTTP {status_code}), retrying in {delay}s")
+    return delay
+
+def hex_to_bytes(value: Optional[str]) -> Optional[bytes]:
+    """Convert a hex hash from bitcoind to the raw bytes stored in BLOB columns"""
+    return bytes.fromhex(value) if value else None
+
+def witness_to_blob(witness: List[str]) -> Optional[bytes]:
+    """Pack a vin's txinwitness list into a compressed BLOB (None when empty)"""
+    return zlib.compress(orjson.dumps(witness), 1) if witness else None
+
+def witness_from_blob(blob: Optional[bytes]) -> List[str]:
+    """Unpack a txinwitness BLOB written by witness_to_blob"""
+    return orjson.loads(zlib.decompress(blob)) if blob else []
+
+def rows_from_tx(tx_data: Dict, block_hash: bytes, block_height: int, block_time: int,
+                 created_at: str) -> Tuple[Tuple, List[Tuple], List[Tuple]]:
+    """Convert one verbose transaction into its transaction, input and output rows"""
+    txid = hex_to_bytes(tx_data['txid'])
+    tx_row = (
+        txid,
+        hex_to_bytes(tx_data.get('hash')),
+        tx_data.get('version', 0),
+        tx_data.get('size', 0),
+        tx_data.get('vsize', 0),
+        tx_data.get('weight', 0),
+        tx_data.get('locktime', 0),
+        block_hash,
+        block_height,
+        block_time,
+        tx_data.get('confirmations', 0),
+        tx_data.get('time', 0),
+        tx_data.get('blocktime', 0),
+        created_at
+    )
+    
+    vin_rows = []
+    for vin in tx_data.get('vin', []):
+        prevout = vin.get('prevout', {})
+        vin_rows.append((
+            txid,
+            vin.get('vout', 0),
+            vin.get('sequence', 0),
+            vin.get('coinbase', ''),
+            witness_to_blob(vin.get('txinwitness')),
+            hex_to_bytes(prevout.get('hash')),
+            prevout.get('n', 0),
+            vin.get('scriptsig', ''),
+            vin.get('scriptsig_asm', ''),
+            vin.get('inner_witnessscript_asm', ''),
+            vin.get('inner_redeemscript_asm', '')
+        ))
+    
+    vout_rows = []
+    for vout in tx_data.get('vout', []):
+        script_pub_key = vout.get('scriptPubKey', {})
+        vout_rows.append((
+            txid,
+            vout.get('n', 0),
+            script_pub_key.get('hex', ''),
+            script_pub_key.get('asm', ''),
+            script_pub_key.get('type', ''),
+            orjson.dumps(script_pub_key.get('addresses', [])).decode(),
+            vout.get('value', 0.0)
+        ))
+    
+    return tx_row, vin_rows, vout_rows
+
+def rows_from_block(block_data: Dict, created_at: str) -> Tuple[Tuple, List[Tuple], List[Tuple], List[Tuple]]:
+    """Convert getblock (verbosity=2) output into rows for the four insert statements"""
+    block_hash = hex_to_bytes(block_data['hash'])
+    block_height = block_data['height']
+    block_time = block_data['time']
+    
+    block_row = (
+        block_hash,
+        block_data.get('confirmations', 0),
+        block_data.get('size', 0),
+        block_data.get('weight', 0),
+        block_height,
+        block_data.get('version', 0),
+        block_data.get('versionHex', ''),
+        hex_to_bytes(block_data.get('merkleroot')),
+        None,  # txids live in the transactions table
+        block_time,
+        block_data.get('mediantime', 0),
+        block_data.get('nonce', 0),
+        block_data.get('bits', ''),
+        block_data.get('difficulty', 0.0),
+        block_data.get('chainwork', ''),
+        block_data.get('nTx', 0),
+        hex_to_bytes(block_data.get('previousblockhash')),
+        hex_to_bytes(block_data.get('nextblockhash')),
+        block_data.get('strippedsize', 0),
+        block_data.get('sigops', 0),
+        created_at
+    )
+    
+    tx_rows, vin_rows, vout_rows = [], [], []
+    txs = block_data.get('tx', [])
+    if not isinstance(txs, list):
+        txs = []
+    
+    for tx_data in txs:
+        tx_row, tx_vin_rows, tx_vout_rows = rows_from_tx(tx_data, block_hash, block_height, block_time, created_at)
+        tx_rows.append(tx_row)
+        vin_rows.extend(tx_vin_rows)
+        vout_rows.extend(tx_vout_rows)
+    
+    return block_row, tx_rows, vin_rows, vout_rows
+
 class BitcoinETL:
     def __init__(self, rpc_url: str, db_path: str):
         self.rpc_url = rpc_url
         self.db_path = db_path
         self.session = requests.Session()
         self.session.auth = ('bitcoinrpc', 'your_rpc_password')  # Update with your credentials
+        # Payloads are pre-encoded with orjson, so the content type is set here
+        self.session.headers['Content-Type'] = 'application/json'
+        adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.conn = self.get_db_connection()
         
+    def post_rpc(self, payload, timeout: int):
+        """POST a JSON-RPC payload, backing off and retrying while bitcoind is overloaded"""
+        body = orjson.dumps(payload)
+        for attempt in range(RPC_MAX_ATTEMPTS):
+            response = self.session.post(self.rpc_url, data=body, timeout=timeout)
+            delay = rpc_retry_delay(attempt, response.status_code)
+            if delay is None:
+                break
+            time.sleep(delay)
+        
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    async def post_rpc_async(self, client: "httpx.AsyncClient", payload):
+        """Async counterpart of post_rpc"""
+        body = orjson.dumps(payload)
+        for attempt in range(RPC_MAX_ATTEMPTS):
+            response = await client.post(self.rpc_url, content=body)
+            delay = rpc_retry_delay(attempt, response.status_code)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
     def rpc_call(self, method: str, params: List = None) -> Dict:
         """Make RPC call to bitcoind"""
-        payload = {
-            "jsonrpc": "1.0",
-            "id": "etl_sync",
-            "method": method,
-            "params": params or []
-        }
+        payload = rpc_request(method, params, "etl_sync")
         
         try:
-            response = self.session.post(self.rpc_url, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
+            result = self.post_rpc(payload, timeout=30)
             
             if 'error' in result and result['error'] is not None:
                 raise Exception(f"RPC Error: {result['error']}")
@@ -54,27 +300,82 @@ class BitcoinETL:
             logger.error(f"RPC call failed for {method}: {e}")
             raise
     
+    def rpc_call_batch(self, calls: List[Tuple[str, List]]) -> List:
+        """Make a batch of RPC calls to bitcoind in a single HTTP request"""
+        payload = rpc_batch_payload(calls)
+        
+        try:
+            return rpc_batch_results(calls, self.post_rpc(payload, timeout=120))
+        except Exception as e:
+            logger.error(f"Batch RPC call failed ({len(calls)} calls): {e}")
+            raise
+    
+    async def rpc_call_batch_async(self, client: "httpx.AsyncClient", calls: List[Tuple[str, List]]) -> List:
+        """Make a batch of RPC calls to bitcoind without blocking the event loop"""
+        payload = rpc_batch_payload(calls)
+        
+        try:
+            return rpc_batch_results(calls, await self.post_rpc_async(client, payload))
+        except Exception as e:
+            logger.error(f"Async batch RPC call failed ({len(calls)} calls): {e}")
+            raise
+    
     def get_db_connection(self) -> sqlite3.Connection:
         """Get SQLite database connection"""
-        conn = sqlite3.connect(self.db_path)
+        # The async sync path writes from a dedicated writer thread; only one thread
+        # ever uses the connection at a time
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        conn.executescript(SQLITE_PRAGMAS)
+        self.check_schema_version(conn)
         return conn
     
+    def check_schema_version(self, conn: sqlite3.Connection):
+        """Refuse to write to a database created with an older schema"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        has_blocks = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blocks'").fetchone()
+        # A new, empty file is fine; init_database creates and stamps the schema
+        if has_blocks and version < SCHEMA_VERSION:
+            conn.close()
+            logger.error(f"Database {self.db_path} has schema version {version}, expected {SCHEMA_VERSION}")
+            raise RuntimeError(f"Database {self.db_path} uses an older schema (hex TEXT hashes); "
+                               f"delete it and run the sync again to rebuild it")
+    
+    def reconnect(self):
+        """Replace the shared connection after a database-level failure"""
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.conn = self.get_db_connection()
+    
+    def close(self):
+        """Close the shared database connection"""
+        self.conn.close()
+    
+    def set_bulk_load_mode(self, conn: sqlite3.Connection, enabled: bool):
+        """Toggle in-memory-journal exclusive writes used while the database is first populated"""
+        if enabled:
+            # The rollback journal is kept in memory, so a failed batch still rolls
+            # back cleanly; only a crash mid-load leaves a corrupt file, acceptable
+            # for the initial sync, which can simply be restarted from scratch
+            conn.executescript("PRAGMA locking_mode=EXCLUSIVE; PRAGMA journal_mode=MEMORY;")
+        else:
+            # locking_mode must go back to NORMAL first or the exclusive lock is kept
+            conn.executescript("PRAGMA locking_mode=NORMAL; PRAGMA journal_mode=WAL;")
+    
     def init_database(self):
         """Initialize database with schema"""
         with open('../sql/schema.sql', 'r') as f:
             schema = f.read()
         
-        conn = self.get_db_connection()
         try:
-            conn.executescript(schema)
-            conn.commit()
+            self.conn.executescript(schema)
+            self.conn.commit()
             logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
             raise
-        finally:
-            conn.close()
     
     def get_latest_block_height(self) -> int:
         """Get the latest block height from bitcoind"""
@@ -87,16 +388,13 @@ class BitcoinETL:
     
     def get_db_latest_height(self) -> int:
         """Get the latest block height from database"""
-        conn = self.get_db_connection()
         try:
-            cursor = conn.execute("SELECT MAX(height) as max_height FROM blocks")
+            cursor = self.conn.execute("SELECT MAX(height) as max_height FROM blocks")
             result = cursor.fetchone()
             return result['max_height'] if result and result['max_height'] else -1
         except Exception as e:
             logger.error(f"Failed to get latest height from database: {e}")
             return -1
-        finally:
-            conn.close()
     
     def fetch_block(self, block_hash: str) -> Dict:
         """Fetch block data with verbosity=2"""
@@ -106,178 +404,103 @@ class BitcoinETL:
             logger.error(f"Failed to fetch block {block_hash}: {e}")
             raise
     
-    def insert_block(self, conn: sqlite3.Connection, block_data: Dict):
-        """Insert block data into database"""
-        try:
-            # Insert block
-            conn.execute("""
-                INSERT OR REPLACE INTO blocks (
-                    hash, confirmations, size, weight, height, version, versionHex,
-                    merkleroot, tx, time, mediantime, nonce, bits, difficulty,
-                    chainwork, nTx, previousblockhash, nextblockhash, strippedsize,
-                    sigops, created_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                block_data['hash'],
-                block_data.get('confirmations', 0),
-                block_data.get('size', 0),
-                block_data.get('weight', 0),
-                block_data['height'],
-                block_data.get('version', 0),
-                block_data.get('versionHex', ''),
-                block_data.get('merkleroot', ''),
-                json.dumps(block_data.get('tx', [])),
-                block_data.get('time', 0),
-                block_data.get('mediantime', 0),
-                block_data.get('nonce', 0),
-                block_data.get('bits', ''),
-                block_data.get('difficulty', 0.0),
-                block_data.get('chainwork', ''),
-                block_data.get('nTx', 0),
-                block_data.get('previousblockhash', ''),
-                block_data.get('nextblockhash', ''),
-                block_data.get('strippedsize', 0),
-                block_data.get('sigops', 0),
-                datetime.now().isoformat()
-            ))
-            
-            # Insert transactions
-            if 'tx' in block_data and isinstance(block_data['tx'], list):
-                for tx in block_data['tx']:
-                    self.insert_transaction(conn, tx, block_data['hash'], block_data['height'], block_data['time'])
-            
-            conn.commit()
-            logger.info(f"Inserted block {block_data['height']} ({block_data['hash'][:8]}...)")
-            
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Failed to insert block {block_data['height']}: {e}")
-            raise
+    def fetch_blocks(self, heights: range) -> List[Dict]:
+        """Fetch full block data for a range of heights in two batched RPCs"""
+        block_hashes = self.rpc_call_batch([('getblockhash', [height]) for height in heights])
+        return self.rpc_call_batch([('getblock', [block_hash, 2]) for block_hash in block_hashes])
     
-    def insert_transaction(self, conn: sqlite3.Connection, tx_data: Dict, block_hash: str, block_height: int, block_time: int):
-        """Insert transaction data into database"""
+    async def fetch_blocks_async(self, client: "httpx.AsyncClient", heights: range) -> List[Dict]:
+        """Fetch full block data for a range of heights in two batched async RPCs"""
+        block_hashes = await self.rpc_call_batch_async(client, [('getblockhash', [height]) for height in heights])
+        return await self.rpc_call_batch_async(client, [('getblock', [block_hash, 2]) for block_hash in block_hashes])
+    
+    def insert_blocks(self, conn: sqlite3.Connection, blocks: List[Dict]):
+        """Insert a batch of blocks and their transactions in a single transaction"""
+        # One timestamp for every row written in this batch
+        created_at = datetime.now().isoformat()
+        block_rows, tx_rows, vin_rows, vout_rows = [], [], [], []
+        for block_data in blocks:
+            block_row, block_tx_rows, block_vin_rows, block_vout_rows = rows_from_block(block_data, created_at)
+            block_rows.append(block_row)
+            tx_rows.extend(block_tx_rows)
+            vin_rows.extend(block_vin_rows)
+            vout_rows.extend(block_vout_rows)
+        
         try:
-            # Insert transaction
-            conn.execute("""
-                INSERT OR REPLACE INTO transactions (
-                    txid, hash, version, size, vsize, weight, locktime,
-                    block_hash, block_height, block_time, confirmations,
-                    time, blocktime, created_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                tx_data['txid'],
-                tx_data.get('hash', ''),
-                tx_data.get('version', 0),
-                tx_data.get('size', 0),
-                tx_data.get('vsize', 0),
-                tx_data.get('weight', 0),
-                tx_data.get('locktime', 0),
-                block_hash,
-                block_height,
-                block_time,
-                tx_data.get('confirmations', 0),
-                tx_data.get('time', 0),
-                tx_data.get('blocktime', 0),
-                datetime.now().isoformat()
-            ))
+            conn.execute("BEGIN")
+            blocks_added = conn.executemany(INSERT_BLOCK_SQL, block_rows).rowcount
+            txs_added = conn.executemany(INSERT_TRANSACTION_SQL, tx_rows).rowcount
+            conn.executemany(INSERT_INPUT_SQL, vin_rows)
+            conn.executemany(INSERT_OUTPUT_SQL, vout_rows)
+            conn.executemany(UPDATE_COUNT_SQL, [(blocks_added, 'blocks'), (txs_added, 'transactions')])
+            conn.execute("COMMIT")
+            logger.info(f"Inserted blocks {blocks[0]['height']}-{blocks[-1]['height']} "
+                        f"({len(tx_rows)} transactions)")
             
-            # Insert inputs
-            if 'vin' in tx_data:
-                for vin in tx_data['vin']:
-                    self.insert_input(conn, vin, tx_data['txid'])
-            
-            # Insert outputs
-            if 'vout' in tx_data:
-                for vout in tx_data['vout']:
-                    self.insert_output(conn, vout, tx_data['txid'])
-                    
         except Exception as e:
-            logger.error(f"Failed to insert transaction {tx_data['txid']}: {e}")
+            conn.rollback()
+            logger.error(f"Failed to insert blocks {blocks[0]['height']}-{blocks[-1]['height']}: {e}")
             raise
     
-    def insert_input(self, conn: sqlite3.Connection, vin: Dict, txid: str):
-        """Insert transaction input data"""
-        try:
-            conn.execute("""
-                INSERT INTO tx_inputs (
-                    txid, vout, sequence, coinbase, txinwitness,
-                    prevout_hash, prevout_n, scriptsig, scriptsig_asm,
-                    inner_witnessscript_asm, inner_redeemscript_asm
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                txid,
-                vin.get('vout', 0),
-                vin.get('sequence', 0),
-                vin.get('coinbase', ''),
-                json.dumps(vin.get('txinwitness', [])),
-                vin.get('prevout', {}).get('hash', ''),
-                vin.get('prevout', {}).get('n', 0),
-                vin.get('scriptsig', ''),
-                vin.get('scriptsig_asm', ''),
-                vin.get('inner_witnessscript_asm', ''),
-                vin.get('inner_redeemscript_asm', '')
-            ))
-        except Exception as e:
-            logger.error(f"Failed to insert input for transaction {txid}: {e}")
-            raise
+    def insert_block(self, conn: sqlite3.Connection, block_data: Dict):
+        """Insert a single block into database"""
+        self.insert_blocks(conn, [block_data])
     
-    def insert_output(self, conn: sqlite3.Connection, vout: Dict, txid: str):
-        """Insert transaction output data"""
-        try:
-            conn.execute("""
-                INSERT INTO tx_outputs (
-                    txid, n, scriptPubKey, scriptPubKey_asm, scriptPubKey_type,
-                    scriptPubKey_addresses, value
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                txid,
-                vout.get('n', 0),
-                vout.get('scriptPubKey', {}).get('hex', ''),
-                vout.get('scriptPubKey', {}).get('asm', ''),
-                vout.get('scriptPubKey', {}).get('type', ''),
-                json.dumps(vout.get('scriptPubKey', {}).get('addresses', [])),
-                vout.get('value', 0.0)
-            ))
-        except Exception as e:
-            logger.error(f"Failed to insert output for transaction {txid}: {e}")
-            raise
+    def find_fork_height(self, conn: sqlite3.Connection, tip_height: int) -> int:
+        """Find the highest stored height whose hash is still on bitcoind's active chain"""
+        heights = list(range(max(0, tip_height - REORG_SEARCH_DEPTH), tip_height + 1))
+        node_hashes = self.rpc_call_batch([('getblockhash', [height]) for height in heights])
+        
+        # Join the node's view of the chain against stored blocks in a single query
+        values = ", ".join("(?, ?)" for _ in heights)
+        params = [value for height, block_hash in zip(heights, node_hashes) for value in (height, hex_to_bytes(block_hash))]
+        cursor = conn.execute(f"""
+            WITH node_chain(height, hash) AS (VALUES {values})
+            SELECT MAX(b.height) AS fork_height
+            FROM blocks b
+            JOIN node_chain n ON b.height = n.height AND b.hash = n.hash
+        """, params)
+        result = cursor.fetchone()
+        return result['fork_height'] if result['fork_height'] is not None else -1
     
     def handle_reorg(self, conn: sqlite3.Connection, new_block: Dict) -> bool:
         """Handle blockchain reorganization"""
         try:
             # Check if we have a fork
-            prev_hash = new_block.get('previousblockhash')
+            prev_hash = hex_to_bytes(new_block.get('previousblockhash'))
             if not prev_hash:
                 return False
             
-            # Check if previous block exists and is at expected height
-            cursor = conn.execute("SELECT height FROM blocks WHERE hash = ?", (prev_hash,))
-            prev_block = cursor.fetchone()
-            
-            if prev_block and prev_block['height'] == new_block['height'] - 1:
-                return False  # No reorg
-            
-            # We have a reorg - find the fork point
-            logger.warning(f"Reorg detected at height {new_block['height']}")
+            height = new_block['height']
+            new_hash = hex_to_bytes(new_block['hash'])
+            cursor = conn.execute("SELECT height, hash FROM blocks WHERE height IN (?, ?)", (height - 1, height))
+            stored = {row['height']: row['hash'] for row in cursor.fetchall()}
             
-            # Find the fork point by walking back
-            fork_height = new_block['height'] - 1
-            while fork_height >= 0:
-                cursor = conn.execute("SELECT hash FROM blocks WHERE height = ?", (fork_height,))
-                block = cursor.fetchone()
-                if block and block['hash'] == new_block.get('previousblockhash'):
-                    break
-                fork_height -= 1
+            if stored.get(height - 1) == prev_hash:
+                if stored.get(height, new_hash) == new_hash:
+                    return False  # No reorg
+                # Parent matches but a stale block is stored at this height
+                fork_height = height - 1
+            elif height - 1 not in stored:
+                return False  # Nothing stored below this block to conflict with
+            else:
+                # We have a reorg - find the fork point
+                logger.warning(f"Reorg detected at height {height}")
+                fork_height = self.find_fork_height(conn, height - 1)
+                if fork_height < 0:
+                    logger.error(f"No fork point found within {REORG_SEARCH_DEPTH} blocks of height {height}")
+                    return False
             
-            if fork_height >= 0:
-                # Remove blocks after fork point
-                conn.execute("DELETE FROM blocks WHERE height > ?", (fork_height,))
-                conn.execute("DELETE FROM transactions WHERE block_height > ?", (fork_height,))
-                conn.execute("DELETE FROM tx_inputs WHERE txid IN (SELECT txid FROM transactions WHERE block_height > ?)", (fork_height,))
-                conn.execute("DELETE FROM tx_outputs WHERE txid IN (SELECT txid FROM transactions WHERE block_height > ?)", (fork_height,))
-                conn.commit()
-                logger.info(f"Removed blocks after height {fork_height} due to reorg")
-                return True
+            # Remove blocks after fork point; inputs and outputs first, while the
+            # transactions they hang off are still there to select from
+            conn.execute("DELETE FROM tx_inputs WHERE txid IN (SELECT txid FROM transactions WHERE block_height > ?)", (fork_height,))
+            conn.execute("DELETE FROM tx_outputs WHERE txid IN (SELECT txid FROM transactions WHERE block_height > ?)", (fork_height,))
+            txs_removed = conn.execute("DELETE FROM transactions WHERE block_height > ?", (fork_height,)).rowcount
+            blocks_removed = conn.execute("DELETE FROM blocks WHERE height > ?", (fork_height,)).rowcount
+            conn.executemany(UPDATE_COUNT_SQL, [(-blocks_removed, 'blocks'), (-txs_removed, 'transactions')])
+            conn.commit()
+            logger.info(f"Removed blocks after height {fork_height} due to reorg")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to handle reorg: {e}")
@@ -285,52 +508,141 @@ class BitcoinETL:
         
         return False
     
-    def sync_blocks(self, start_height: int = None, max_blocks: int = None):
-        """Sync blocks from start_height to latest"""
+    def plan_sync(self, start_height: int = None, max_blocks: int = None) -> Tuple[int, int, bool]:
+        """Work out the height range to sync and whether this is the initial load"""
+        latest_height = self.get_latest_block_height()
+        db_latest_height = self.get_db_latest_height()
+        current_height = start_height or db_latest_height + 1
+        initial_sync = db_latest_height < 0
+        
+        if max_blocks:
+            end_height = min(current_height + max_blocks - 1, latest_height)
+        else:
+            end_height = latest_height
+        
+        return current_height, end_height, initial_sync
+    
+    def write_batch(self, heights: range, blocks: List[Dict]) -> bool:
+        """Apply one fetched batch to the database; returns True if a reorg was handled"""
         try:
-            latest_height = self.get_latest_block_height()
-            current_height = start_height or self.get_db_latest_height() + 1
+            # Check for reorg against the first block; the rest of the
+            # batch chains onto it
+            if self.handle_reorg(self.conn, blocks[0]):
+                return True
             
-            if max_blocks:
-                end_height = min(current_height + max_blocks - 1, latest_height)
-            else:
-                end_height = latest_height
+            # Insert the whole batch in one transaction
+            self.insert_blocks(self.conn, blocks)
             
+        except sqlite3.OperationalError as e:
+            logger.error(f"Failed to sync blocks {heights[0]}-{heights[-1]}: {e}")
+            self.reconnect()
+        except Exception as e:
+            logger.error(f"Failed to sync blocks {heights[0]}-{heights[-1]}: {e}")
+        
+        return False
+    
+    def sync_blocks(self, start_height: int = None, max_blocks: int = None):
+        """Sync blocks from start_height to latest"""
+        try:
+            current_height, end_height, initial_sync = self.plan_sync(start_height, max_blocks)
             logger.info(f"Starting sync from height {current_height} to {end_height}")
             
-            conn = self.get_db_connection()
+            if initial_sync:
+                self.set_bulk_load_mode(self.conn, True)
             try:
-                for height in range(current_height, end_height + 1):
-                    try:
-                        # Get block hash by height
-                        block_hash = self.rpc_call('getblockhash', [height])
-                        
-                        # Fetch full block data
-                        block_data = self.fetch_block(block_hash)
+                with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+                    pending = deque()
+                    next_height = current_height
+                    
+                    while pending or next_height <= end_height:
+                        # Keep fetchers busy ahead of the writer; the window bounds memory
+                        while next_height <= end_height and len(pending) < FETCH_WORKERS:
+                            heights = range(next_height, min(next_height + RPC_BATCH_SIZE, end_height + 1))
+                            pending.append((heights, executor.submit(self.fetch_blocks, heights)))
+                            next_height = heights[-1] + 1
                         
-                        # Check for reorg
-                        if self.handle_reorg(conn, block_data):
-                            # Reorg handled, continue with current block
-                            pass
+                        heights, future = pending.popleft()
+                        try:
+                            blocks = future.result()
+                        except Exception as e:
+                            logger.error(f"Failed to fetch blocks {heights[0]}-{heights[-1]}: {e}")
+                            continue
                         
-                        # Insert block
-                        self.insert_block(conn, block_data)
+                        if self.write_batch(heights, blocks):
+                            # Reorg handled, drop prefetched batches and re-sync
+                            # from just above the fork point
+                            for _, stale in pending:
+                                stale.cancel()
+                            pending.clear()
+                            next_height = self.get_db_latest_height() + 1
+                            continue
                         
                         # Progress update
-                        if height % 100 == 0:
-                            logger.info(f"Synced {height - current_height + 1} blocks...")
+                        logger.info(f"Synced {heights[-1] - current_height + 1} blocks...")
+                
+                logger.info(f"Sync completed. Synced {end_height - current_height + 1} blocks")
+                
+            finally:
+                if initial_sync:
+                    self.set_bulk_load_mode(self.conn, False)
+                
+        except Exception as e:
+            logger.error(f"Sync failed: {e}")
+            raise
+    
+    async def sync_blocks_async(self, start_height: int = None, max_blocks: int = None):
+        """Sync blocks like sync_blocks, fetching over asyncio instead of worker threads"""
+        if httpx is None:
+            raise RuntimeError("httpx is required for async sync (pip install httpx)")
+        
+        try:
+            current_height, end_height, initial_sync = self.plan_sync(start_height, max_blocks)
+            logger.info(f"Starting async sync from height {current_height} to {end_height}")
+            
+            loop = asyncio.get_running_loop()
+            # SQLite writes run on one dedicated thread so the event loop keeps fetching
+            writer = ThreadPoolExecutor(max_workers=1)
+            limits = httpx.Limits(max_connections=ASYNC_FETCH_WINDOW, max_keepalive_connections=ASYNC_FETCH_WINDOW)
+            
+            if initial_sync:
+                await loop.run_in_executor(writer, self.set_bulk_load_mode, self.conn, True)
+            try:
+                async with httpx.AsyncClient(auth=self.session.auth, headers={'Content-Type': 'application/json'}, limits=limits, timeout=120) as client:
+                    pending = deque()
+                    next_height = current_height
+                    
+                    while pending or next_height <= end_height:
+                        while next_height <= end_height and len(pending) < ASYNC_FETCH_WINDOW:
+                            heights = range(next_height, min(next_height + RPC_BATCH_SIZE, end_height + 1))
+                            pending.append((heights, asyncio.ensure_future(self.fetch_blocks_async(client, heights))))
+                            next_height = heights[-1] + 1
+                        
+                        heights, task = pending.popleft()
+                        try:
+                            blocks = await task
+                        except Exception as e:
+                            logger.error(f"Failed to fetch blocks {heights[0]}-{heights[-1]}: {e}")
+                            continue
                         
-                        # Small delay to avoid overwhelming the RPC
-                        time.sleep(0.1)
+                        if await loop.run_in_executor(writer, self.write_batch, heights, blocks):
+                            # Reorg handled, drop prefetched batches and re-sync
+                            # from just above the fork point
+                            for _, stale in pending:
+                                stale.cancel()
+                            await asyncio.gather(*(stale for _, stale in pending), return_exceptions=True)
+                            pending.clear()
+                            next_height = await loop.run_in_executor(writer, self.get_db_latest_height) + 1
+                            continue
                         
-                    except Exception as e:
-                        logger.error(f"Failed to sync block {height}: {e}")
-                        continue
+                        # Progress update
+                        logger.info(f"Synced {heights[-1] - current_height + 1} blocks...")
                 
                 logger.info(f"Sync completed. Synced {end_height - current_height + 1} blocks")
                 
             finally:
-                conn.close()
+                if initial_sync:
+                    await loop.run_in_executor(writer, self.set_bulk_load_mode, self.conn, False)
+                writer.shutdown()
                 
         except Exception as e:
             logger.error(f"Sync failed: {e}")
@@ -338,28 +650,36 @@ class BitcoinETL:
 
 def main():
     """Main function"""
-    # Configuration
-    RPC_URL = "http://127.0.0.1:8332"
-    DB_PATH = "../data/btc.db"
+    parser = argparse.ArgumentParser(description="Sync bitcoind blocks into SQLite")
+    parser.add_argument("--rpc-url", default="http://127.0.0.1:8332", help="bitcoind JSON-RPC endpoint")
+    parser.add_argument("--db-path", default="../data/btc.db", help="SQLite database file")
+    parser.add_argument("--max-blocks", type=int, default=100000, help="Maximum number of blocks to sync")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Fetch blocks with asyncio/httpx instead of threads")
+    args = parser.parse_args()
     
     # Create data directory if it doesn't exist
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    os.makedirs(os.path.dirname(args.db_path) or ".", exist_ok=True)
     
     # Initialize ETL
-    etl = BitcoinETL(RPC_URL, DB_PATH)
+    etl = BitcoinETL(args.rpc_url, args.db_path)
     
     try:
         # Initialize database
         etl.init_database()
         
         # Sync blocks (last 100k blocks or until disk space runs out)
-        etl.sync_blocks(max_blocks=100000)
+        if args.use_async:
+            asyncio.run(etl.sync_blocks_async(max_blocks=args.max_blocks))
+        else:
+            etl.sync_blocks(max_blocks=args.max_blocks)
         
     except KeyboardInterrupt:
         logger.info("Sync interrupted by user")
     except Exception as e:
         logger.error(f"Sync failed: {e}")
         raise
+    finally:
+        etl.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -4,39 +4,113 @@ Bitcoin Reorg Checker
 Optional script to validate blockchain consistency by checking the last N blocks
 """
 
+import os
 import sqlite3
+from urllib.parse import quote
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import asyncio
+import itertools
+import math
 import logging
-from typing import Dict, List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Optional
 from datetime import datetime, timedelta
-import time
+
+try:
+    import aiohttp
+except ImportError:  # Only needed for use_async=True
+    aiohttp = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Connection pool for RPC traffic; sized for the concurrent batch fetches
+RPC_POOL_CONNECTIONS = 4
+RPC_POOL_MAXSIZE = 32
+
+# The checker only reads: query_only guards against accidental writes, and mmap plus
+# a 64 MB page cache keep the blocks range in memory. WAL itself is set by the ETL
+# writer, since a read-only connection cannot change the journal mode.
+SQLITE_READ_PRAGMAS = """
+    PRAGMA query_only=1;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-65536;
+"""
+
+# Large batches are split into chunks fetched concurrently. Workers stay below
+# bitcoind's default -rpcthreads (16) so requests don't pile up in its work queue.
+RPC_BATCH_CHUNK = 24
+RPC_WORKERS = 8
+
+# When its work queue is full bitcoind answers 503 (429 from a proxy); such requests
+# are retried with exponential backoff, at most RPC_MAX_ATTEMPTS tries
+RPC_MAX_ATTEMPTS = 5
+RPC_MAX_BACKOFF = 8
+RPC_OVERLOAD_STATUSES = (429, 503)
+
+# Responses that are fixed for a given chain tip and safe to reuse between checks
+CACHEABLE_RPC_METHODS = frozenset({'getblockhash', 'getblock', 'getblockheader'})
+
+# Fixed leading bytes of every single-call request body; only method and params vary
+RPC_PAYLOAD_PREFIX = b'{"jsonrpc":"1.0","id":"reorg_check","method":"'
+
+# Difficulty is a float; values within this absolute (or 1e-9 relative) tolerance match
+DIFFICULTY_ABS_TOL = 1e-3
+DIFFICULTY_REL_TOL = 1e-9
+
 class ReorgChecker:
-    def __init__(self, db_path: str, rpc_url: str, rpc_auth: Tuple[str, str]):
+    def __init__(self, db_path: str, rpc_url: str, rpc_auth: Tuple[str, str], use_async: bool = False):
+        if use_async and aiohttp is None:
+            raise RuntimeError("aiohttp is required for use_async=True (pip install aiohttp)")
+        
         self.db_path = db_path
         self.rpc_url = rpc_url
         self.rpc_auth = rpc_auth
+        self.use_async = use_async
         self.session = requests.Session()
         self.session.auth = rpc_auth
+        # Keep connections alive across both checks; the RPCs are read-only, so
+        # retrying POSTs on transient failures and overload responses is safe
+        retry = Retry(
+            total=RPC_MAX_ATTEMPTS - 1,
+            backoff_factor=0.5,
+            status_forcelist=RPC_OVERLOAD_STATUSES,
+            allowed_methods=frozenset({'POST'}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=RPC_POOL_CONNECTIONS, pool_maxsize=RPC_POOL_MAXSIZE, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Connection'] = 'keep-alive'
+        # Payloads are pre-encoded with orjson, so the content type is set here
+        self.session.headers['Content-Type'] = 'application/json'
+        
+        # (method, params) -> result, valid while bitcoind's tip is _cache_tip
+        self._rpc_cache: Dict[Tuple, any] = {}
+        self._cache_tip = None
+        
+        # Shared read-only connection, opened on first use
+        self._conn = None
+        
+        # Open the connection up front so the first check doesn't pay for the handshake
+        try:
+            self.rpc_call('getblockcount')
+        except Exception as e:
+            logger.warning(f"bitcoind warm-up call failed: {e}")
     
     def rpc_call(self, method: str, params: List = None) -> Dict:
         """Make RPC call to bitcoind"""
-        payload = {
-            "jsonrpc": "1.0",
-            "id": "reorg_check",
-            "method": method,
-            "params": params or []
-        }
+        # Splice method and params onto the constant prefix instead of serializing a dict
+        payload = RPC_PAYLOAD_PREFIX + method.encode() + b'","params":' + orjson.dumps(params or []) + b'}'
         
         try:
-            response = self.session.post(self.rpc_url, json=payload, timeout=30)
+            response = self.session.post(self.rpc_url, data=payload, timeout=30)
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
             
             if 'error' in result and result['error'] is not None:
                 raise Exception(f"RPC Error: {result['error']}")
@@ -46,242 +120,387 @@ class ReorgChecker:
             logger.error(f"RPC call failed for {method}: {e}")
             raise
     
-    def get_db_connection(self) -> sqlite3.Connection:
-        """Get SQLite database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    def _batch_payload(self, calls: List[Tuple[str, List]]) -> Tuple[List, List[Tuple], List[Dict]]:
+        """Fill results from the cache; return (values, cache keys, payload for the misses)"""
+        values = [None] * len(calls)
+        keys = [(method, tuple(params or [])) for method, params in calls]
+        payload = []
+        for i, key in enumerate(keys):
+            if key in self._rpc_cache:
+                values[i] = self._rpc_cache[key]
+            else:
+                payload.append({
+                    "jsonrpc": "1.0",
+                    "id": i,
+                    "method": calls[i][0],
+                    "params": calls[i][1] or []
+                })
+        return values, keys, payload
     
-    def check_block_consistency(self, num_blocks: int = 144) -> Dict[str, any]:
-        """Check consistency of the last N blocks (default: 144 = ~1 day)"""
-        logger.info(f"Checking consistency of last {num_blocks} blocks")
+    def _store_batch_results(self, calls: List[Tuple[str, List]], keys: List[Tuple], values: List, results: List[Dict]):
+        """Place batch results by id into values, caching the cacheable ones"""
+        for result in results:
+            i = result['id']
+            method, params = calls[i]
+            if result.get('error') is not None:
+                logger.error(f"RPC call failed for {method} {params}: {result['error']}")
+            else:
+                values[i] = result['result']
+                if method in CACHEABLE_RPC_METHODS:
+                    self._rpc_cache[keys[i]] = result['result']
+    
+    def rpc_batch(self, calls: List[Tuple[str, List]]) -> List:
+        """Make a batch of RPC calls in one HTTP request; failed calls come back as None"""
+        # Serve what we can from the cache and only send the rest
+        values, keys, payload = self._batch_payload(calls)
+        if not payload:
+            return values
         
         try:
-            # Get latest block height from database
-            conn = self.get_db_connection()
-            cursor = conn.execute("SELECT MAX(height) as max_height FROM blocks")
-            db_latest = cursor.fetchone()
-            
-            if not db_latest or db_latest['max_height'] is None:
-                raise Exception("No blocks found in database")
-            
-            db_latest_height = db_latest['max_height']
-            start_height = max(0, db_latest_height - num_blocks + 1)
-            
-            logger.info(f"Checking blocks from height {start_height} to {db_latest_height}")
-            
-            # Get blocks from database
-            cursor = conn.execute("""
-                SELECT height, hash, previousblockhash, time 
-                FROM blocks 
-                WHERE height >= ? 
-                ORDER BY height
-            """, (start_height,))
-            
-            db_blocks = {row['height']: dict(row) for row in cursor.fetchall()}
-            
-            # Get blocks from bitcoind
-            bitcoind_blocks = {}
-            for height in range(start_height, db_latest_height + 1):
-                try:
-                    block_hash = self.rpc_call('getblockhash', [height])
-                    block_info = self.rpc_call('getblock', [block_hash, 1])
-                    
-                    bitcoind_blocks[height] = {
-                        'height': height,
-                        'hash': block_hash,
-                        'previousblockhash': block_info.get('previousblockhash', ''),
-                        'time': block_info.get('time', 0)
-                    }
-                    
-                    # Small delay to avoid overwhelming RPC
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    logger.error(f"Failed to get block {height} from bitcoind: {e}")
-                    continue
+            response = self.session.post(self.rpc_url, data=orjson.dumps(payload), timeout=120)
+            response.raise_for_status()
+            results = orjson.loads(response.content)
+        except Exception as e:
+            logger.error(f"Batch RPC call failed ({len(payload)} calls): {e}")
+            raise
+        
+        self._store_batch_results(calls, keys, values, results)
+        return values
+    
+    async def _arpc_batch(self, session: "aiohttp.ClientSession", calls: List[Tuple[str, List]]) -> List:
+        """Async counterpart of rpc_batch"""
+        values, keys, payload = self._batch_payload(calls)
+        if not payload:
+            return values
+        
+        body = orjson.dumps(payload)
+        try:
+            # aiohttp has no retry adapter, so back off on overload here
+            for attempt in range(RPC_MAX_ATTEMPTS):
+                async with session.post(self.rpc_url, data=body) as response:
+                    if response.status not in RPC_OVERLOAD_STATUSES or attempt == RPC_MAX_ATTEMPTS - 1:
+                        response.raise_for_status()
+                        results = orjson.loads(await response.read())
+                        break
+                delay = min(2 ** attempt, RPC_MAX_BACKOFF)
+                logger.warning(f"bitcoind overloaded (HTTP {response.status}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+        except Exception as e:
+            logger.error(f"Batch RPC call failed ({len(payload)} calls): {e}")
+            raise
+        
+        self._store_batch_results(calls, keys, values, results)
+        return values
+    
+    async def _arun(self, chunks: List[List[Tuple[str, List]]]) -> List[List]:
+        """Send all chunks concurrently on one event loop over one aiohttp session"""
+        # The connection limit, not the number of tasks, bounds load on bitcoind
+        connector = aiohttp.TCPConnector(limit=RPC_WORKERS, keepalive_timeout=60)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            auth=aiohttp.BasicAuth(*self.rpc_auth),
+            headers={'Content-Type': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=120)
+        ) as session:
+            return await asyncio.gather(*(self._arpc_batch(session, chunk) for chunk in chunks))
+    
+    def refresh_rpc_cache(self):
+        """Drop cached RPC responses if bitcoind's tip has moved since they were fetched"""
+        tip = self.rpc_call('getbestblockhash')
+        if tip != self._cache_tip:
+            self._rpc_cache.clear()
+            self._cache_tip = tip
+    
+    def rpc_batch_parallel(self, calls: List[Tuple[str, List]]) -> List:
+        """Split a batch into chunks and send them concurrently; results keep call order"""
+        if len(calls) <= RPC_BATCH_CHUNK:
+            return self.rpc_batch(calls)
+        
+        chunks = [calls[i:i + RPC_BATCH_CHUNK] for i in range(0, len(calls), RPC_BATCH_CHUNK)]
+        if self.use_async:
+            chunk_results = asyncio.run(self._arun(chunks))
+        else:
+            with ThreadPoolExecutor(max_workers=min(RPC_WORKERS, len(chunks))) as executor:
+                chunk_results = list(executor.map(self.rpc_batch, chunks))
+        return [result for results in chunk_results for result in results]
+    
+    def fetch_node_blocks(self, heights: range, db_hashes: Dict[int, str]) -> Dict[int, Dict]:
+        """Fetch bitcoind's active-chain block header data for each height"""
+        node_blocks = {}
+        
+        # On a healthy chain the stored hashes are right, so one getblock batch suffices
+        known = [height for height in heights if db_hashes.get(height)]
+        block_infos = self.rpc_batch_parallel([('getblock', [db_hashes[height], 1]) for height in known])
+        for height, block_info in zip(known, block_infos):
+            # Stale blocks are still served, but with confirmations == -1
+            if block_info and block_info.get('confirmations', -1) >= 0 and block_info.get('height') == height:
+                node_blocks[height] = block_info
+        
+        # Heights missing from the database or stored off the active chain
+        fallback = [height for height in heights if height not in node_blocks]
+        block_hashes = self.rpc_batch_parallel([('getblockhash', [height]) for height in fallback])
+        fetched = [(height, block_hash) for height, block_hash in zip(fallback, block_hashes) if block_hash]
+        block_infos = self.rpc_batch_parallel([('getblock', [block_hash, 1]) for _, block_hash in fetched])
+        for (height, _), block_info in zip(fetched, block_infos):
+            if block_info is not None:
+                node_blocks[height] = block_info
+        
+        return node_blocks
+    
+    def get_db_connection(self) -> sqlite3.Connection:
+        """Get the shared SQLite database connection"""
+        if self._conn is None:
+            # Read-only open never takes a write lock, so it can't block a running ETL sync
+            self._conn = sqlite3.connect(f"file:{quote(os.path.abspath(self.db_path))}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.executescript(SQLITE_READ_PRAGMAS)
+        return self._conn
+    
+    def close(self):
+        """Close the shared database connection"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    def _read_db_blocks(self, num_blocks: int) -> Tuple[range, Dict[int, Tuple]]:
+        """Read the last N blocks from the database"""
+        conn = self.get_db_connection()
+        db_latest_height = conn.execute("SELECT MAX(height) FROM blocks").fetchone()[0]
+        
+        if db_latest_height is None:
+            raise Exception("No blocks found in database")
+        
+        start_height = max(0, db_latest_height - num_blocks + 1)
+        heights = range(start_height, db_latest_height + 1)
+        
+        logger.info(f"Checking blocks from height {start_height} to {db_latest_height}")
+        
+        # Get blocks from database as (hash, previousblockhash, time, chainwork,
+        # difficulty) tuples. Hashes stay as the raw 32-byte values stored
+        cursor = conn.execute("""
+            SELECT height, hash, previousblockhash, time, chainwork, difficulty 
+            FROM blocks 
+            WHERE height BETWEEN ? AND ?
+        """, (start_height, db_latest_height))
+        
+        db_blocks = {
+            height: (block_hash or b'', prev_hash or b'', block_time, chainwork, difficulty)
+            for height, block_hash, prev_hash, block_time, chainwork, difficulty in cursor
+        }
+        return heights, db_blocks
+    
+    def _fast_chain_tip_check(self, heights: range, db_blocks: Dict[int, Tuple]) -> Optional[Dict[int, Dict]]:
+        """Confirm from raw 80-byte headers that the stored blocks are bitcoind's active chain"""
+        if not heights or len(db_blocks) != len(heights):
+            return None
+        
+        # The active block at our tip height, plus the raw header of every stored block
+        calls = [('getblockhash', [heights[-1]])]
+        calls += [('getblockheader', [db_blocks[height][0].hex(), False]) for height in heights]
+        results = self.rpc_batch_parallel(calls)
+        tip_hash, headers = results[0], results[1:]
+        if tip_hash is None or bytes.fromhex(tip_hash) != db_blocks[heights[-1]][0]:
+            return None
+        
+        # A header commits to its parent, so if the tip is active and every stored block's
+        # header points at the stored block below it, the whole range is the active chain
+        node_blocks = {}
+        for height, header in zip(heights, headers):
+            if header is None:
+                return None
+            raw = bytes.fromhex(header)
+            # Header layout: version (4), prev hash (32, little-endian), merkle root (32), time (4), ...
+            prev_hash = raw[4:36][::-1]
+            if height > heights[0] and prev_hash != db_blocks[height - 1][0]:
+                return None
+            node_blocks[height] = {
+                'height': height,
+                'hash': db_blocks[height][0],
+                'previousblockhash': prev_hash,
+                'time': int.from_bytes(raw[68:72], 'little')
+            }
+        return node_blocks
+    
+    def _fetch_all(self, num_blocks: int) -> Tuple[range, Dict[int, Tuple], Dict[int, Dict]]:
+        """Read the last N blocks from the database and bitcoind once, for every check"""
+        self.refresh_rpc_cache()
+        heights, db_blocks = self._read_db_blocks(num_blocks)
+        
+        # Get blocks from bitcoind, looked up by the hashes we have stored, and
+        # decode their hashes once so comparisons are 32-byte bytes compares
+        node_blocks = self.fetch_node_blocks(heights, {height: block[0].hex() for height, block in db_blocks.items()})
+        bitcoind_blocks = {
+            height: {
+                'height': height,
+                'hash': bytes.fromhex(block_info['hash']),
+                'previousblockhash': bytes.fromhex(block_info.get('previousblockhash', '')),
+                'time': block_info.get('time', 0),
+                'chainwork': block_info.get('chainwork', ''),
+                'difficulty': block_info.get('difficulty', 0)
+            }
+            for height, block_info in node_blocks.items()
+        }
+        
+        return heights, db_blocks, bitcoind_blocks
+    
+    def _iter_block_inconsistencies(self, present: List[int], start_height: int, db_blocks: Dict[int, Tuple], bitcoind_blocks: Dict[int, Dict]) -> Iterator[Dict]:
+        """Yield hash and previous-hash mismatches for the heights present on both sides"""
+        # One pass: each height is compared and its mismatches yielded straight
+        # away, so a caller that stops early never touches the rest
+        for height in present:
+            db_hash = db_blocks[height][0]
+            btc_block = bitcoind_blocks[height]
             
-            # Compare blocks
-            inconsistencies = []
-            missing_blocks = []
+            # Check hash consistency
+            if db_hash != btc_block['hash']:
+                yield {
+                    'height': height,
+                    'type': 'hash_mismatch',
+                    'db_hash': db_hash.hex(),
+                    'bitcoind_hash': btc_block['hash'].hex(),
+                    'description': 'Block hash mismatch between database and bitcoind'
+                }
             
-            for height in range(start_height, db_latest_height + 1):
-                if height not in db_blocks:
-                    missing_blocks.append(height)
-                    continue
-                
-                if height not in bitcoind_blocks:
-                    logger.warning(f"Block {height} not found in bitcoind")
-                    continue
-                
-                db_block = db_blocks[height]
-                btc_block = bitcoind_blocks[height]
-                
-                # Check hash consistency
-                if db_block['hash'] != btc_block['hash']:
-                    inconsistency = {
+            # Check previous block hash consistency
+            if height > start_height and height - 1 in db_blocks and height - 1 in bitcoind_blocks:
+                db_prev_hash = db_blocks[height - 1][0]
+                if db_prev_hash != btc_block['previousblockhash']:
+                    yield {
                         'height': height,
-                        'type': 'hash_mismatch',
-                        'db_hash': db_block['hash'],
-                        'bitcoind_hash': btc_block['hash'],
-                        'description': 'Block hash mismatch between database and bitcoind'
+                        'type': 'prev_hash_mismatch',
+                        'db_prev_hash': db_prev_hash.hex(),
+                        'bitcoind_prev_hash': btc_block['previousblockhash'].hex(),
+                        'description': 'Previous block hash mismatch'
                     }
-                    inconsistencies.append(inconsistency)
-                
-                # Check previous block hash consistency
-                if height > start_height:
-                    prev_height = height - 1
-                    if prev_height in db_blocks and prev_height in bitcoind_blocks:
-                        db_prev_hash = db_blocks[prev_height]['hash']
-                        btc_prev_hash = btc_block['previousblockhash']
-                        
-                        if db_prev_hash != btc_prev_hash:
-                            inconsistency = {
-                                'height': height,
-                                'type': 'prev_hash_mismatch',
-                                'db_prev_hash': db_prev_hash,
-                                'bitcoind_prev_hash': btc_prev_hash,
-                                'description': 'Previous block hash mismatch'
-                            }
-                            inconsistencies.append(inconsistency)
-            
-            conn.close()
-            
-            # Generate report
-            total_blocks_checked = len(bitcoind_blocks)
-            consistency_percentage = ((total_blocks_checked - len(inconsistencies)) / total_blocks_checked * 100) if total_blocks_checked > 0 else 0
+    
+    def _block_report(self, heights: range, db_blocks: Dict[int, Tuple], bitcoind_blocks: Dict[int, Dict], check_time: Optional[str] = None, max_reported: Optional[int] = None) -> Dict[str, any]:
+        """Compare block and previous-block hashes and build the block consistency report"""
+        start_height = heights[0] if heights else 0
+        
+        # Partition the range once instead of testing membership per height
+        expected = set(heights)
+        in_db = expected & db_blocks.keys()
+        missing_blocks = sorted(expected - in_db)
+        for height in sorted(in_db - bitcoind_blocks.keys()):
+            logger.warning(f"Block {height} not found in bitcoind")
+        
+        # Build at most max_reported entries; the rest are only counted
+        found = self._iter_block_inconsistencies(sorted(in_db & bitcoind_blocks.keys()), start_height, db_blocks, bitcoind_blocks)
+        inconsistencies = list(itertools.islice(found, max_reported))
+        total_inconsistencies = len(inconsistencies) + sum(1 for _ in found)
+        
+        # Generate report
+        total_blocks_checked = len(bitcoind_blocks)
+        consistency_percentage = ((total_blocks_checked - total_inconsistencies) / total_blocks_checked * 100) if total_blocks_checked > 0 else 0
+        
+        return {
+            'check_time': check_time or datetime.now().isoformat(),
+            'blocks_checked': {
+                'start_height': start_height,
+                'end_height': heights[-1] if heights else start_height,
+                'total': total_blocks_checked
+            },
+            'consistency': {
+                'percentage': round(consistency_percentage, 2),
+                'total_inconsistencies': total_inconsistencies,
+                'missing_blocks': len(missing_blocks)
+            },
+            'inconsistencies': inconsistencies,
+            'missing_blocks': missing_blocks,
+            'status': 'healthy' if total_inconsistencies == 0 else 'inconsistent'
+        }
+    
+    def _iter_chainwork_inconsistencies(self, present: List[int], db_blocks: Dict[int, Tuple], bitcoind_blocks: Dict[int, Dict]) -> Iterator[Dict]:
+        """Yield chainwork and difficulty mismatches for the heights present on both sides"""
+        # One pass, as in _iter_block_inconsistencies
+        for height in present:
+            db_chainwork, db_difficulty = db_blocks[height][3], db_blocks[height][4]
+            btc_chainwork, btc_difficulty = bitcoind_blocks[height]['chainwork'], bitcoind_blocks[height]['difficulty']
             
-            report = {
-                'check_time': datetime.now().isoformat(),
-                'blocks_checked': {
-                    'start_height': start_height,
-                    'end_height': db_latest_height,
-                    'total': total_blocks_checked
-                },
-                'consistency': {
-                    'percentage': round(consistency_percentage, 2),
-                    'total_inconsistencies': len(inconsistencies),
-                    'missing_blocks': len(missing_blocks)
-                },
-                'inconsistencies': inconsistencies,
-                'missing_blocks': missing_blocks,
-                'status': 'healthy' if len(inconsistencies) == 0 else 'inconsistent'
-            }
+            # Chainwork is a 256-bit hex string; compare it numerically so differences in
+            # zero padding do not show up as mismatches
+            delta = int(btc_chainwork or '0', 16) - int(db_chainwork or '0', 16)
+            if delta != 0:
+                yield {
+                    'height': height,
+                    'type': 'chainwork_mismatch',
+                    'db_chainwork': db_chainwork,
+                    'bitcoind_chainwork': btc_chainwork,
+                    'delta': delta,
+                    'description': 'Chainwork mismatch between database and bitcoind'
+                }
             
-            return report
+            if not math.isclose(db_difficulty, btc_difficulty, rel_tol=DIFFICULTY_REL_TOL, abs_tol=DIFFICULTY_ABS_TOL):
+                yield {
+                    'height': height,
+                    'type': 'difficulty_mismatch',
+                    'db_difficulty': db_difficulty,
+                    'bitcoind_difficulty': btc_difficulty,
+                    'description': 'Difficulty mismatch between database and bitcoind'
+                }
+    
+    def _chainwork_report(self, heights: range, db_blocks: Dict[int, Tuple], bitcoind_blocks: Dict[int, Dict], check_time: Optional[str] = None, max_reported: Optional[int] = None) -> Dict[str, any]:
+        """Compare chainwork and difficulty and build the chainwork consistency report"""
+        # Build at most max_reported entries; the rest are only counted
+        found = self._iter_chainwork_inconsistencies(sorted(set(heights) & db_blocks.keys() & bitcoind_blocks.keys()), db_blocks, bitcoind_blocks)
+        chainwork_inconsistencies = list(itertools.islice(found, max_reported))
+        total_inconsistencies = len(chainwork_inconsistencies) + sum(1 for _ in found)
+        
+        total_blocks_checked = len(bitcoind_blocks)
+        chainwork_consistency = ((total_blocks_checked - total_inconsistencies) / total_blocks_checked * 100) if total_blocks_checked > 0 else 0
+        
+        return {
+            'check_time': check_time or datetime.now().isoformat(),
+            'blocks_checked': total_blocks_checked,
+            'chainwork_consistency': round(chainwork_consistency, 2),
+            'total_inconsistencies': total_inconsistencies,
+            'inconsistencies': chainwork_inconsistencies,
+            'status': 'healthy' if total_inconsistencies == 0 else 'inconsistent'
+        }
+    
+    def check_block_consistency(self, num_blocks: int = 144, check_time: Optional[str] = None, max_reported: Optional[int] = None) -> Dict[str, any]:
+        """Check consistency of the last N blocks (default: 144 = ~1 day)"""
+        logger.info(f"Checking consistency of last {num_blocks} blocks")
+        
+        try:
+            # Healthy chains are confirmed from raw headers alone; verbose blocks are
+            # only fetched when that fails and the mismatches need to be located
+            self.refresh_rpc_cache()
+            heights, db_blocks = self._read_db_blocks(num_blocks)
+            header_blocks = self._fast_chain_tip_check(heights, db_blocks)
+            if header_blocks is not None:
+                return self._block_report(heights, db_blocks, header_blocks, check_time, max_reported)
             
+            return self._block_report(*self._fetch_all(num_blocks), check_time=check_time, max_reported=max_reported)
         except Exception as e:
             logger.error(f"Block consistency check failed: {e}")
             raise
     
-    def check_chain_work(self, num_blocks: int = 144) -> Dict[str, any]:
+    def check_chain_work(self, num_blocks: int = 144, check_time: Optional[str] = None, max_reported: Optional[int] = None) -> Dict[str, any]:
         """Check chainwork consistency of the last N blocks"""
         logger.info(f"Checking chainwork consistency of last {num_blocks} blocks")
         
         try:
-            conn = self.get_db_connection()
-            cursor = conn.execute("SELECT MAX(height) as max_height FROM blocks")
-            db_latest = cursor.fetchone()
-            
-            if not db_latest or db_latest['max_height'] is None:
-                raise Exception("No blocks found in database")
-            
-            db_latest_height = db_latest['max_height']
-            start_height = max(0, db_latest_height - num_blocks + 1)
-            
-            # Get chainwork from database
-            cursor = conn.execute("""
-                SELECT height, chainwork, difficulty 
-                FROM blocks 
-                WHERE height >= ? 
-                ORDER BY height
-            """, (start_height,))
-            
-            db_chainwork = {row['height']: dict(row) for row in cursor.fetchall()}
-            
-            # Get chainwork from bitcoind
-            bitcoind_chainwork = {}
-            for height in range(start_height, db_latest_height + 1):
-                try:
-                    block_hash = self.rpc_call('getblockhash', [height])
-                    block_info = self.rpc_call('getblock', [block_hash, 1])
-                    
-                    bitcoind_chainwork[height] = {
-                        'height': height,
-                        'chainwork': block_info.get('chainwork', ''),
-                        'difficulty': block_info.get('difficulty', 0)
-                    }
-                    
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    logger.error(f"Failed to get block {height} chainwork from bitcoind: {e}")
-                    continue
-            
-            # Compare chainwork
-            chainwork_inconsistencies = []
-            
-            for height in range(start_height, db_latest_height + 1):
-                if height not in db_chainwork or height not in bitcoind_chainwork:
-                    continue
-                
-                db_block = db_chainwork[height]
-                btc_block = bitcoind_chainwork[height]
-                
-                if db_block['chainwork'] != btc_block['chainwork']:
-                    inconsistency = {
-                        'height': height,
-                        'type': 'chainwork_mismatch',
-                        'db_chainwork': db_block['chainwork'],
-                        'bitcoind_chainwork': btc_block['chainwork'],
-                        'description': 'Chainwork mismatch between database and bitcoind'
-                    }
-                    chainwork_inconsistencies.append(inconsistency)
-                
-                if abs(db_block['difficulty'] - btc_block['difficulty']) > 0.001:
-                    inconsistency = {
-                        'height': height,
-                        'type': 'difficulty_mismatch',
-                        'db_difficulty': db_block['difficulty'],
-                        'bitcoind_difficulty': btc_block['difficulty'],
-                        'description': 'Difficulty mismatch between database and bitcoind'
-                    }
-                    chainwork_inconsistencies.append(inconsistency)
-            
-            conn.close()
-            
-            total_blocks_checked = len(bitcoind_chainwork)
-            chainwork_consistency = ((total_blocks_checked - len(chainwork_inconsistencies)) / total_blocks_checked * 100) if total_blocks_checked > 0 else 0
-            
-            report = {
-                'check_time': datetime.now().isoformat(),
-                'blocks_checked': total_blocks_checked,
-                'chainwork_consistency': round(chainwork_consistency, 2),
-                'total_inconsistencies': len(chainwork_inconsistencies),
-                'inconsistencies': chainwork_inconsistencies,
-                'status': 'healthy' if len(chainwork_inconsistencies) == 0 else 'inconsistent'
-            }
-            
-            return report
-            
+            return self._chainwork_report(*self._fetch_all(num_blocks), check_time=check_time, max_reported=max_reported)
         except Exception as e:
             logger.error(f"Chainwork consistency check failed: {e}")
             raise
     
-    def run_full_consistency_check(self, num_blocks: int = 144) -> Dict[str, any]:
+    def run_full_consistency_check(self, num_blocks: int = 144, max_reported: Optional[int] = None) -> Dict[str, any]:
         """Run a full consistency check including both block and chainwork validation"""
         logger.info("Running full consistency check")
         
         try:
-            # Run block consistency check
-            block_report = self.check_block_consistency(num_blocks)
+            # One timestamp for the whole check, shared by both sub-reports
+            check_time = datetime.now().isoformat()
             
-            # Run chainwork consistency check
-            chainwork_report = self.check_chain_work(num_blocks)
+            # Fetch once from the database and bitcoind, then run both comparisons
+            heights, db_blocks, bitcoind_blocks = self._fetch_all(num_blocks)
+            block_report = self._block_report(heights, db_blocks, bitcoind_blocks, check_time, max_reported)
+            chainwork_report = self._chainwork_report(heights, db_blocks, bitcoind_blocks, check_time, max_reported)
             
             # Combine reports
             full_report = {
-                'check_time': datetime.now().isoformat(),
+                'check_time': check_time,
                 'blocks_checked': num_blocks,
                 'block_consistency': block_report,
                 'chainwork_consistency': chainwork_report,
@@ -303,7 +522,6 @@ def main():
     RPC_AUTH = ('bitcoinrpc', 'your_rpc_password')  # Update with your credentials
     
     # Check if database exists
-    import os
     if not os.path.exists(DB_PATH):
         print(f"Database not found at {DB_PATH}")
         print("Please run the ETL sync first to create the database.")
@@ -314,7 +532,8 @@ def main():
     
     try:
         # Run full consistency check
-        report = checker.run_full_consistency_check(num_blocks=144)
+        # Only the first few inconsistencies are printed, so only those are built
+        report = checker.run_full_consistency_check(num_blocks=144, max_reported=5)
         
         print("Bitcoin Blockchain Consistency Check Report")
         print("=" * 50)
@@ -343,16 +562,16 @@ def main():
             print("Block Inconsistencies:")
             for inc in block_consistency['inconsistencies'][:5]:  # Show first 5
                 print(f"  Height {inc['height']}: {inc['description']}")
-            if len(block_consistency['inconsistencies']) > 5:
-                print(f"  ... and {len(block_consistency['inconsistencies']) - 5} more")
+            if block_consistency['consistency']['total_inconsistencies'] > 5:
+                print(f"  ... and {block_consistency['consistency']['total_inconsistencies'] - 5} more")
             print()
         
         if chainwork_consistency['total_inconsistencies'] > 0:
             print("Chainwork Inconsistencies:")
             for inc in chainwork_consistency['inconsistencies'][:5]:  # Show first 5
                 print(f"  Height {inc['height']}: {inc['description']}")
-            if len(chainwork_consistency['inconsistencies']) > 5:
-                print(f"  ... and {len(chainwork_consistency['inconsistencies']) - 5} more")
+            if chainwork_consistency['total_inconsistencies'] > 5:
+                print(f"  ... and {chainwork_consistency['total_inconsistencies'] - 5} more")
             print()
         
         if report['overall_status'] == 'healthy':
@@ -363,6 +582,8 @@ def main():
         
     except Exception as e:
         print(f"Consistency check failed: {e}")
+    finally:
+        checker.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
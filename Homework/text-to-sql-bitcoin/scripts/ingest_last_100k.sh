@@ -16,9 +16,9 @@ fi
 
 # Check if required Python packages are installed
 echo "Checking Python dependencies..."
-python3 -c "import sqlite3, requests, openai" 2>/dev/null || {
+python3 -c "import sqlite3, requests, orjson, openai" 2>/dev/null || {
     echo "Installing required Python packages..."
-    pip3 install requests openai
+    pip3 install requests orjson openai
 }
 
 # Set default values
@@ -16,6 +16,14 @@ def read_requirements():
     with open("requirements.txt", "r", encoding="utf-8") as fh:
         return [line.strip() for line in fh if line.strip() and not line.startswith("#")]
 
+# Opt-in native build of the SQL validator with mypyc (BITCOIN_T2S_MYPYC=1 pip install .);
+# the pure-Python module is used otherwise
+def mypyc_extensions():
+    if os.environ.get("BITCOIN_T2S_MYPYC") != "1":
+        return []
+    from mypyc.build import mypycify
+    return mypycify(["--ignore-missing-imports", "text2sql/validator.py"])
+
 setup(
     name="bitcoin-text-to-sql",
     version="1.0.0",
@@ -45,6 +53,7 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=read_requirements(),
+    ext_modules=mypyc_extensions(),
     extras_require={
         "dev": [
             "pytest>=6.2.0",
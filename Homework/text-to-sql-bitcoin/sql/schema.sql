@@ -3,15 +3,15 @@
 
 -- Blocks table
 CREATE TABLE IF NOT EXISTS blocks (
-    hash TEXT PRIMARY KEY,
+    hash BLOB PRIMARY KEY, -- 32-byte hashes are stored raw, not as hex
     confirmations INTEGER,
     size INTEGER,
     weight INTEGER,
     height INTEGER UNIQUE,
     version INTEGER,
     versionHex TEXT,
-    merkleroot TEXT,
-    tx TEXT, -- JSON array of transaction hashes
+    merkleroot BLOB,
+    tx TEXT, -- unused (NULL); use SELECT txid FROM transactions WHERE block_hash = ?
     time INTEGER,
     mediantime INTEGER,
     nonce INTEGER,
@@ -19,24 +19,23 @@ CREATE TABLE IF NOT EXISTS blocks (
     difficulty REAL,
     chainwork TEXT,
     nTx INTEGER,
-    previousblockhash TEXT,
-    nextblockhash TEXT,
+    previousblockhash BLOB,
+    nextblockhash BLOB,
     strippedsize INTEGER,
-    weight INTEGER,
     sigops INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Transactions table
 CREATE TABLE IF NOT EXISTS transactions (
-    txid TEXT PRIMARY KEY,
-    hash TEXT,
+    txid BLOB PRIMARY KEY,
+    hash BLOB,
     version INTEGER,
     size INTEGER,
     vsize INTEGER,
     weight INTEGER,
     locktime INTEGER,
-    block_hash TEXT,
+    block_hash BLOB,
     block_height INTEGER,
     block_time INTEGER,
     confirmations INTEGER,
@@ -50,12 +49,12 @@ CREATE TABLE IF NOT EXISTS transactions (
 -- Transaction inputs table
 CREATE TABLE IF NOT EXISTS tx_inputs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    txid TEXT,
+    txid BLOB,
     vout INTEGER,
     sequence INTEGER,
     coinbase TEXT,
-    txinwitness TEXT, -- JSON array
-    prevout_hash TEXT,
+    txinwitness BLOB, -- zlib-compressed JSON array of hex items, NULL if none
+    prevout_hash BLOB,
     prevout_n INTEGER,
     scriptsig TEXT,
     scriptsig_asm TEXT,
@@ -67,7 +66,7 @@ CREATE TABLE IF NOT EXISTS tx_inputs (
 -- Transaction outputs table
 CREATE TABLE IF NOT EXISTS tx_outputs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    txid TEXT,
+    txid BLOB,
     n INTEGER,
     scriptPubKey TEXT,
     scriptPubKey_asm TEXT,
@@ -88,6 +87,14 @@ CREATE TABLE IF NOT EXISTS block_stats (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Row counts kept up to date by the ETL, so stats don't need COUNT(*) scans
+CREATE TABLE IF NOT EXISTS counts (
+    name TEXT PRIMARY KEY,
+    n INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counts (name, n) SELECT 'blocks', COUNT(*) FROM blocks;
+INSERT OR IGNORE INTO counts (name, n) SELECT 'transactions', COUNT(*) FROM transactions;
+
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_blocks_height ON blocks(height);
 CREATE INDEX IF NOT EXISTS idx_blocks_time ON blocks(time);
@@ -122,9 +129,13 @@ SELECT
     t.weight,
     t.confirmations,
     COUNT(ti.id) as input_count,
-    COUNT(to.id) as output_count,
-    SUM(to.value) as total_output_value
+    COUNT(txo.id) as output_count,
+    SUM(txo.value) as total_output_value
 FROM transactions t
 LEFT JOIN tx_inputs ti ON t.txid = ti.txid
-LEFT JOIN tx_outputs to ON t.txid = to.txid
-GROUP BY t.txid, t.block_height, t.block_time, t.size, t.weight, t.confirmations; 
\ No newline at end of file
+LEFT JOIN tx_outputs txo ON t.txid = txo.txid
+GROUP BY t.txid, t.block_height, t.block_time, t.size, t.weight, t.confirmations; 
+
+-- Schema version, checked by the ETL before it writes. Version 2 stores hashes
+-- as 32-byte BLOBs; databases from the hex TEXT layout must be rebuilt
+PRAGMA user_version = 2;
@@ -6,18 +6,55 @@ Runs all test cases and generates comprehensive results
 
 import json
 import sqlite3
+import itertools
 import sys
 import os
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Tuple, Any
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 import time
 
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib json module is used instead
+    orjson = None
+
 # Add parent directory to path to import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from text2sql.text_to_sql import BitcoinTextToSQL
 from text2sql.validator import SQLValidator
 
+# Test cases run concurrently; kept small to stay under OpenAI rate limits
+TEST_WORKERS = 8
+
+# Without OpenAI the cases are CPU-bound, so they run in worker processes,
+# leaving two cores free for the rest of the machine
+PROCESS_WORKERS = max(1, (os.cpu_count() or 1) - 2)
+
+# Below this many cases, starting worker processes (each building its own
+# TestRunner and caches) costs more than it saves, so threads are used instead
+PROCESS_MIN_CASES = 200
+
+# Rows fetched per case; larger results are reported as "more than" this
+PREVIEW_ROWS = 10
+
+# Per-process runner for ProcessPoolExecutor workers, built once by _init_worker
+_worker_runner = None
+
+def _init_worker(db_path: str):
+    """Build the worker process's TestRunner (converter and validator) once"""
+    global _worker_runner
+    _worker_runner = TestRunner(db_path)
+
+def _run_passing_in_worker(case: Dict) -> Tuple[Dict, List[str]]:
+    """Run a passing test case in a worker process"""
+    return _worker_runner._run_one_passing(case)
+
+def _run_hard_in_worker(case: Dict) -> Tuple[Dict, List[str]]:
+    """Run a hard test case in a worker process"""
+    return _worker_runner._run_one_hard(case)
+
 class TestRunner:
     def __init__(self, db_path: str, openai_api_key: str = None):
         self.db_path = db_path
@@ -34,14 +71,17 @@ class TestRunner:
             'errors': []
         }
     
+    def _load_json(self, path: str) -> Any:
+        """Parse a JSON file, with orjson when available"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    
     def load_test_cases(self) -> tuple[List[Dict], List[Dict]]:
         """Load test cases from JSON files"""
         try:
-            with open('cases_pass.json', 'r') as f:
-                passing_cases = json.load(f)
-            
-            with open('cases_hard.json', 'r') as f:
-                hard_cases = json.load(f)
+            passing_cases = self._load_json('cases_pass.json')
+            hard_cases = self._load_json('cases_hard.json')
             
             return passing_cases, hard_cases
             
@@ -49,220 +89,270 @@ class TestRunner:
             print(f"Error loading test cases: {e}")
             return [], []
     
+    def _use_processes(self, total: int) -> bool:
+        """Whether a run of total cases goes to worker processes"""
+        return not self.openai_api_key and total >= PROCESS_MIN_CASES
+    
+    def _make_executor(self, total: int) -> Executor:
+        """Threads for the I/O-bound OpenAI path and small runs, processes for large rule-based runs"""
+        if not self._use_processes(total):
+            return ThreadPoolExecutor(max_workers=max(1, min(total, TEST_WORKERS)))
+        return ProcessPoolExecutor(
+            max_workers=max(1, min(total, PROCESS_WORKERS)),
+            initializer=_init_worker,
+            initargs=(self.db_path,)
+        )
+    
+    def _run_one_passing(self, case: Dict) -> Tuple[Dict, List[str]]:
+        """Run a single passing test case; returns the result and its log lines"""
+        log = []
+        log.append(f"Difficulty: {case['difficulty']}")
+        log.append("-" * 50)
+        
+        try:
+            # Convert question to SQL
+            start_time = time.time()
+            sql_result = self.converter.convert_to_sql(case['question'], use_openai=bool(self.openai_api_key))
+            conversion_time = time.time() - start_time
+            
+            log.append(f"Generated SQL: {sql_result}")
+            log.append(f"Expected SQL: {case['expected_sql']}")
+            
+            # Validate SQL
+            sql_valid, sql_msg = self.validator.validate_sql(sql_result)
+            question_valid, question_msg = self.validator.validate_question(case['question'])
+            
+            log.append(f"SQL Valid: {sql_valid} - {sql_msg}")
+            log.append(f"Question Valid: {question_valid} - {question_msg}")
+            
+            # Execute SQL limited to a preview, keeping only the first rows; one
+            # row past the preview shows whether the result was truncated
+            start_time = time.time()
+            rows, columns = self.converter.iter_sql(sql_result, preview=PREVIEW_ROWS)
+            results_data = list(itertools.islice(rows, 3))
+            results_count = len(results_data) + sum(1 for _ in rows)
+            results_truncated = results_count > PREVIEW_ROWS
+            results_count = min(results_count, PREVIEW_ROWS)
+            execution_time = time.time() - start_time
+            
+            # Check if results are reasonable
+            results_reasonable = self._check_results_reasonable(results_data, case)
+            
+            # Determine if test passed
+            test_passed = (
+                sql_valid and 
+                question_valid and 
+                results_reasonable and
+                results_count > 0
+            )
+            
+            status = "PASS" if test_passed else "FAIL"
+            
+            # Store result
+            result = {
+                'case_id': case['id'],
+                'question': case['question'],
+                'difficulty': case['difficulty'],
+                'expected_sql': case['expected_sql'],
+                'generated_sql': sql_result,
+                'sql_valid': sql_valid,
+                'question_valid': question_valid,
+                'results_count': results_count,
+                'results_truncated': results_truncated,
+                'results_reasonable': results_reasonable,
+                'conversion_time': conversion_time,
+                'execution_time': execution_time,
+                'status': status,
+                'actual_results': results_data,  # First 3 results
+                'columns': columns
+            }
+            
+            log.append(f"Results: {'more than ' if results_truncated else ''}{results_count} rows")
+            log.append(f"Results Reasonable: {results_reasonable}")
+            log.append(f"Status: {status}")
+            log.append(f"Conversion Time: {conversion_time:.3f}s")
+            log.append(f"Execution Time: {execution_time:.3f}s")
+            
+            if results_data:
+                log.append("Sample Results:")
+                for j, row in enumerate(results_data[:2]):
+                    log.append(f"  Row {j+1}: {dict(row)}")
+            
+        except Exception as e:
+            log.append(f"Error running test case: {e}")
+            result = {
+                'case_id': case['id'],
+                'question': case['question'],
+                'difficulty': case['difficulty'],
+                'status': 'ERROR',
+                'error': str(e)
+            }
+        
+        return result, log
+    
     def run_passing_cases(self, cases: List[Dict]) -> List[Dict]:
         """Run the 10 passing test cases"""
         print("\n" + "="*60)
         print("RUNNING PASSING TEST CASES")
         print("="*60)
         
-        results = []
-        passed = 0
         total = len(cases)
         
-        for i, case in enumerate(cases, 1):
-            print(f"\nTest Case {i}/{total}: {case['question']}")
-            print(f"Difficulty: {case['difficulty']}")
-            print("-" * 50)
+        # Cases are independent, so run them concurrently; logs are printed
+        # afterwards in case order
+        run_one = _run_passing_in_worker if self._use_processes(total) else self._run_one_passing
+        with self._make_executor(total) as executor:
+            outcomes = list(executor.map(run_one, cases))
+        
+        results = []
+        passed = 0
+        output = []
+        for i, (case, (result, log)) in enumerate(zip(cases, outcomes), 1):
+            output.append(f"\nTest Case {i}/{total}: {case['question']}")
+            output.extend(log)
             
-            try:
-                # Convert question to SQL
-                start_time = time.time()
-                sql_result = self.converter.convert_to_sql(case['question'], use_openai=bool(self.openai_api_key))
-                conversion_time = time.time() - start_time
-                
-                print(f"Generated SQL: {sql_result}")
-                print(f"Expected SQL: {case['expected_sql']}")
-                
-                # Validate SQL
-                sql_valid, sql_msg = self.validator.validate_sql(sql_result)
-                question_valid, question_msg = self.validator.validate_question(case['question'])
-                
-                print(f"SQL Valid: {sql_valid} - {sql_msg}")
-                print(f"Question Valid: {question_valid} - {question_msg}")
-                
-                # Execute SQL
-                start_time = time.time()
-                execution_result = self.converter.execute_sql(sql_result)
-                execution_time = time.time() - start_time
-                
-                results_data, columns = execution_result
-                
-                # Check if results are reasonable
-                results_reasonable = self._check_results_reasonable(results_data, case)
-                
-                # Determine if test passed
-                test_passed = (
-                    sql_valid and 
-                    question_valid and 
-                    results_reasonable and
-                    len(results_data) > 0
-                )
-                
-                if test_passed:
-                    passed += 1
-                    status = "PASS"
-                else:
-                    status = "FAIL"
-                
-                # Store result
-                result = {
-                    'case_id': case['id'],
-                    'question': case['question'],
-                    'difficulty': case['difficulty'],
-                    'expected_sql': case['expected_sql'],
-                    'generated_sql': sql_result,
-                    'sql_valid': sql_valid,
-                    'question_valid': question_valid,
-                    'results_count': len(results_data),
-                    'results_reasonable': results_reasonable,
-                    'conversion_time': conversion_time,
-                    'execution_time': execution_time,
-                    'status': status,
-                    'actual_results': results_data[:3] if results_data else [],  # Store first 3 results
-                    'columns': columns
-                }
-                
-                results.append(result)
-                
-                print(f"Results: {len(results_data)} rows")
-                print(f"Results Reasonable: {results_reasonable}")
-                print(f"Status: {status}")
-                print(f"Conversion Time: {conversion_time:.3f}s")
-                print(f"Execution Time: {execution_time:.3f}s")
-                
-                if results_data:
-                    print("Sample Results:")
-                    for j, row in enumerate(results_data[:2]):
-                        print(f"  Row {j+1}: {dict(row)}")
-                
-            except Exception as e:
-                print(f"Error running test case: {e}")
-                result = {
-                    'case_id': case['id'],
-                    'question': case['question'],
-                    'difficulty': case['difficulty'],
-                    'status': 'ERROR',
-                    'error': str(e)
-                }
-                results.append(result)
+            results.append(result)
+            if result['status'] == 'PASS':
+                passed += 1
+            elif result['status'] == 'ERROR':
                 self.results['errors'].append(result)
         
+        # Flush all case logs with a single write
+        sys.stdout.write("\n".join(output) + "\n")
         print(f"\nPassing Cases Summary: {passed}/{total} passed")
         self.results['summary']['passing_cases'] = {'passed': passed, 'total': total}
         self.results['passing_cases'] = results
         
         return results
     
+    def _run_one_hard(self, case: Dict) -> Tuple[Dict, List[str]]:
+        """Run a single hard test case; returns the result and its log lines"""
+        log = []
+        log.append(f"Difficulty: {case['difficulty']}")
+        log.append(f"Expected to fail because: {case['reason_unanswerable']}")
+        log.append("-" * 50)
+        
+        try:
+            # Convert question to SQL
+            start_time = time.time()
+            sql_result = self.converter.convert_to_sql(case['question'], use_openai=bool(self.openai_api_key))
+            conversion_time = time.time() - start_time
+            
+            log.append(f"Generated SQL: {sql_result}")
+            log.append(f"Expected SQL: {case['expected_sql']}")
+            
+            # Validate SQL
+            sql_valid, sql_msg = self.validator.validate_sql(sql_result)
+            question_valid, question_msg = self.validator.validate_question(case['question'])
+            
+            log.append(f"SQL Valid: {sql_valid} - {sql_msg}")
+            log.append(f"Question Valid: {question_valid} - {question_msg}")
+            
+            # For hard cases, we expect the question to be invalid
+            expected_to_fail = not question_valid
+            
+            status = "CORRECTLY_FAILED" if expected_to_fail else "INCORRECTLY_PASSED"
+            
+            # Store result
+            result = {
+                'case_id': case['id'],
+                'question': case['question'],
+                'difficulty': case['difficulty'],
+                'expected_sql': case['expected_sql'],
+                'generated_sql': sql_result,
+                'sql_valid': sql_valid,
+                'question_valid': question_valid,
+                'expected_to_fail': True,
+                'correctly_failed': expected_to_fail,
+                'conversion_time': conversion_time,
+                'status': status,
+                'reason_unanswerable': case['reason_unanswerable']
+            }
+            
+            log.append(f"Expected to fail: True")
+            log.append(f"Correctly failed: {expected_to_fail}")
+            log.append(f"Status: {status}")
+            log.append(f"Conversion Time: {conversion_time:.3f}s")
+            
+        except Exception as e:
+            log.append(f"Error running hard test case: {e}")
+            result = {
+                'case_id': case['id'],
+                'question': case['question'],
+                'difficulty': case['difficulty'],
+                'status': 'ERROR',
+                'error': str(e)
+            }
+        
+        return result, log
+    
     def run_hard_cases(self, cases: List[Dict]) -> List[Dict]:
         """Run the 3 hard test cases that should fail"""
         print("\n" + "="*60)
         print("RUNNING HARD TEST CASES (Expected to Fail)")
         print("="*60)
         
-        results = []
-        correctly_failed = 0
         total = len(cases)
         
-        for i, case in enumerate(cases, 1):
-            print(f"\nHard Test Case {i}/{total}: {case['question']}")
-            print(f"Difficulty: {case['difficulty']}")
-            print(f"Expected to fail because: {case['reason_unanswerable']}")
-            print("-" * 50)
+        run_one = _run_hard_in_worker if self._use_processes(total) else self._run_one_hard
+        with self._make_executor(total) as executor:
+            outcomes = list(executor.map(run_one, cases))
+        
+        results = []
+        correctly_failed = 0
+        output = []
+        for i, (case, (result, log)) in enumerate(zip(cases, outcomes), 1):
+            output.append(f"\nHard Test Case {i}/{total}: {case['question']}")
+            output.extend(log)
             
-            try:
-                # Convert question to SQL
-                start_time = time.time()
-                sql_result = self.converter.convert_to_sql(case['question'], use_openai=bool(self.openai_api_key))
-                conversion_time = time.time() - start_time
-                
-                print(f"Generated SQL: {sql_result}")
-                print(f"Expected SQL: {case['expected_sql']}")
-                
-                # Validate SQL
-                sql_valid, sql_msg = self.validator.validate_sql(sql_result)
-                question_valid, question_msg = self.validator.validate_question(case['question'])
-                
-                print(f"SQL Valid: {sql_valid} - {sql_msg}")
-                print(f"Question Valid: {question_valid} - {question_msg}")
-                
-                # For hard cases, we expect the question to be invalid
-                expected_to_fail = not question_valid
-                
-                if expected_to_fail:
-                    correctly_failed += 1
-                    status = "CORRECTLY_FAILED"
-                else:
-                    status = "INCORRECTLY_PASSED"
-                
-                # Store result
-                result = {
-                    'case_id': case['id'],
-                    'question': case['question'],
-                    'difficulty': case['difficulty'],
-                    'expected_sql': case['expected_sql'],
-                    'generated_sql': sql_result,
-                    'sql_valid': sql_valid,
-                    'question_valid': question_valid,
-                    'expected_to_fail': True,
-                    'correctly_failed': expected_to_fail,
-                    'conversion_time': conversion_time,
-                    'status': status,
-                    'reason_unanswerable': case['reason_unanswerable']
-                }
-                
-                results.append(result)
-                
-                print(f"Expected to fail: True")
-                print(f"Correctly failed: {expected_to_fail}")
-                print(f"Status: {status}")
-                print(f"Conversion Time: {conversion_time:.3f}s")
-                
-            except Exception as e:
-                print(f"Error running hard test case: {e}")
-                result = {
-                    'case_id': case['id'],
-                    'question': case['question'],
-                    'difficulty': case['difficulty'],
-                    'status': 'ERROR',
-                    'error': str(e)
-                }
-                results.append(result)
+            results.append(result)
+            if result['status'] == 'CORRECTLY_FAILED':
+                correctly_failed += 1
+            elif result['status'] == 'ERROR':
                 self.results['errors'].append(result)
         
+        sys.stdout.write("\n".join(output) + "\n")
         print(f"\nHard Cases Summary: {correctly_failed}/{total} correctly failed")
         self.results['summary']['hard_cases'] = {'correctly_failed': correctly_failed, 'total': total}
         self.results['hard_cases'] = results
         
         return results
     
+    def _classify_question(self, question: str) -> str:
+        """Categorize a question by the kind of result it should produce"""
+        question = question.lower()
+        if 'count' in question or 'how many' in question:
+            return 'count'
+        elif 'latest' in question or 'current' in question:
+            return 'latest'
+        elif 'average' in question or 'avg' in question:
+            return 'average'
+        else:
+            return 'generic'
+    
     def _check_results_reasonable(self, results: List[Dict], case: Dict) -> bool:
         """Check if the results are reasonable for the given case"""
         if not results:
             return False
         
-        # Basic reasonableness checks based on case type
-        if 'count' in case['question'].lower() or 'how many' in case['question'].lower():
-            # Should return numeric results
-            for row in results:
-                for value in row.values():
-                    if isinstance(value, (int, float)) and value >= 0:
-                        return True
-            return False
+        # Classified once per case and kept on it for later runs
+        if 'category' not in case:
+            case['category'] = self._classify_question(case['question'])
+        category = case['category']
         
-        elif 'latest' in case['question'].lower() or 'current' in case['question'].lower():
-            # Should return recent data
-            return len(results) > 0
+        # Basic reasonableness checks based on case type; aggregates come back
+        # as a single row, so the first row is enough
+        first = results[0]
+        if category == 'count':
+            # Should return non-negative numeric results
+            return any(isinstance(value, (int, float)) and value >= 0 for value in first.values())
         
-        elif 'average' in case['question'].lower() or 'avg' in case['question'].lower():
+        elif category == 'average':
             # Should return numeric results
-            for row in results:
-                for value in row.values():
-                    if isinstance(value, (int, float)):
-                        return True
-            return False
+            return any(isinstance(value, (int, float)) for value in first.values())
         
         else:
-            # Generic check - just ensure we have some results
+            # Latest/current data and everything else: just ensure we have some results
             return len(results) > 0
     
     def generate_report(self) -> str:
@@ -336,9 +426,15 @@ class TestRunner:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"test_results_{timestamp}.json"
         
+        # Everything in the results is JSON-native already (execute_sql decodes
+        # hashes and timestamps), so no per-object default= fallback is needed
         try:
-            with open(filename, 'w') as f:
-                json.dump(self.results, f, indent=2, default=str)
+            if orjson is not None:
+                with open(filename, 'wb') as f:
+                    f.write(orjson.dumps(self.results, option=orjson.OPT_INDENT_2))
+            else:
+                with open(filename, 'w') as f:
+                    json.dump(self.results, f, indent=2)
             print(f"\nResults saved to: {filename}")
         except Exception as e:
             print(f"Error saving results: {e}")
@@ -355,6 +451,13 @@ class TestRunner:
             print("No test cases loaded. Exiting.")
             return
         
+        # Generate SQL for every case in one OpenAI request; the per-case conversions
+        # below are then answered from the converter's cache
+        if self.openai_api_key:
+            start_time = time.time()
+            self.converter.convert_batch([case['question'] for case in passing_cases + hard_cases])
+            print(f"Batch SQL generation: {len(passing_cases) + len(hard_cases)} questions in {time.time() - start_time:.3f}s")
+        
         # Run passing cases
         if passing_cases:
             self.run_passing_cases(passing_cases)
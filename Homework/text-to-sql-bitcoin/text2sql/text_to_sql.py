@@ -6,17 +6,134 @@ Converts natural language questions to SQL queries and executes them
 
 import sqlite3
 import json
+import asyncio
 import re
-from typing import Dict, List, Optional, Tuple, Any
+import zlib
+import time
+import hashlib
+import functools
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 import logging
 from datetime import datetime, timedelta
 import openai
 import os
+from urllib.parse import quote
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Read-side connection tuning: WAL lets queries run while the ETL is writing, and
+# the large page cache and mmap keep hot pages of the blocks table in memory.
+SQLITE_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-262144;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA foreign_keys=OFF;
+"""
+
+# Rule-based fallback: (keywords that must all appear, SQL), checked in order
+RULE_BASED_QUERIES: List[Tuple[Tuple[str, ...], str]] = [
+    (('total', 'blocks'), "SELECT COUNT(*) as total_blocks FROM blocks"),
+    (('latest', 'block'), "SELECT * FROM blocks ORDER BY height DESC LIMIT 1"),
+    (('transaction', 'count'), "SELECT COUNT(*) as total_transactions FROM transactions"),
+    (('difficulty', 'current'), "SELECT difficulty FROM blocks ORDER BY height DESC LIMIT 1"),
+    (('block', 'size', 'average'), "SELECT AVG(size) as avg_block_size FROM blocks"),
+    # This is complex - would need more context
+    (('address', 'balance'), "SELECT 'Complex query - address balance requires specific address' as note"),
+]
+RULE_BASED_FALLBACK = "SELECT 'Unable to generate SQL for this question' as error"
+
+# The rules compiled once at import: one lookahead per keyword, so keywords may
+# appear in any order, as substrings, exactly like the table above
+RULE_BASED_RULES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(''.join(f'(?=.*{re.escape(keyword)})' for keyword in keywords), re.DOTALL), sql)
+    for keywords, sql in RULE_BASED_QUERIES
+]
+
+# Whole-question patterns whose SQL is certain enough to skip OpenAI entirely.
+# The keyword rules above are too loose for that ("total number of transactions
+# across all blocks" matches total+blocks), so these are anchored.
+RULE_BASED_EXACT: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r'^how many (total )?blocks( are there)?\??$'), "SELECT COUNT(*) as total_blocks FROM blocks"),
+    (re.compile(r'^what is the latest block\??$'), "SELECT * FROM blocks ORDER BY height DESC LIMIT 1"),
+    (re.compile(r'^how many (total )?transactions( are there)?\??$'), "SELECT COUNT(*) as total_transactions FROM transactions"),
+    (re.compile(r'^what is the current difficulty\??$'), "SELECT difficulty FROM blocks ORDER BY height DESC LIMIT 1"),
+    (re.compile(r'^what is the average block size\??$'), "SELECT AVG(size) as avg_block_size FROM blocks"),
+]
+
+# Rows fetched from SQLite per round trip when streaming query results
+FETCH_BATCH_SIZE = 1000
+
+# execute_sql keeps results of recent queries while the database is unchanged;
+# larger results are not kept
+RESULT_CACHE_SIZE = 128
+RESULT_CACHE_MAX_ROWS = 1000
+
+# Only plain SELECTs are cached, and not those whose result depends on the
+# clock or on chance, which would go stale without the database changing
+CACHEABLE_SQL_RE = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+VOLATILE_SQL_RE = re.compile(r"'now'|\bCURRENT_(?:TIME|DATE|TIMESTAMP)\b|\brandom(?:blob)?\s*\(", re.IGNORECASE)
+
+# Queries that preview= may wrap, and a LIMIT already ending the outer query
+# (a LIMIT inside a subquery is followed by a closing parenthesis)
+SELECT_RE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+OUTER_LIMIT_RE = re.compile(r'\bLIMIT\b[^()]*$', re.IGNORECASE)
+
+# String literals, quoted identifiers and comments, blanked out before the LIMIT
+# test so a LIMIT or parenthesis inside them is not mistaken for query structure
+SQL_QUOTED_RE = re.compile(r"'(?:''|[^'])*'|\"(?:\"\"|[^\"])*\"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+# Prepared statements kept per connection (sqlite3 defaults to 128)
+SQLITE_CACHED_STATEMENTS = 256
+
+# Integer columns presented as ISO datetimes in query results
+TIMESTAMP_COLUMNS = frozenset({'time', 'block_time', 'created_at'})
+
+# BLOB columns in the schema (raw hashes, compressed witness data), presented as
+# hex or decoded in query results
+BLOB_COLUMNS = frozenset({
+    'hash', 'merkleroot', 'previousblockhash', 'nextblockhash',
+    'txid', 'block_hash', 'prevout_hash', 'txinwitness',
+})
+
+# Block timestamps are UTC Unix seconds; formatted as in datetime.isoformat() for UTC
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+# Schema notes included in every OpenAI prompt
+SQL_PROMPT_NOTES = """Important Notes:
+- Use SQLite syntax
+- Bitcoin amounts are stored in BTC (not satoshis)
+- Timestamps are Unix timestamps
+- Hashes (hash, txid, block_hash, merkleroot, previousblockhash, nextblockhash, prevout_hash) are 32-byte BLOBs; compare with X'<hex>' literals and use hex() to display them
+- Addresses are stored as JSON arrays in scriptPubKey_addresses
+- tx_inputs.txinwitness is compressed and cannot be filtered on in SQL
+- Use proper JOINs when querying across tables
+- Always use LIMIT for large result sets"""
+
+# System message sent with every OpenAI request
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a SQL expert. Generate only SQL queries, no explanations."}
+
+# Model for convert_batch; it must support JSON-object responses
+BATCH_MODEL = "gpt-4o-mini"
+
+# OpenAI requests convert_batch_async keeps in flight at once
+OPENAI_CONCURRENCY = 8
+
+# Markdown code fences stripped from OpenAI responses (opening, then closing)
+SQL_FENCE_OPEN_RE = re.compile(r'```sql\s*')
+SQL_FENCE_CLOSE_RE = re.compile(r'\s*```')
+
+# Question -> SQL memo for OpenAI generations, persisted across runs. Entries are
+# only valid for the schema they were generated against.
+SQL_CACHE_PATH = os.path.expanduser("~/.cache/bitcoin_t2s_sql.json")
+
+# Minimum seconds between database mtime checks for schema changes
+SCHEMA_RECHECK_INTERVAL = 60
+
 class BitcoinTextToSQL:
     def __init__(self, db_path: str, openai_api_key: str = None):
         self.db_path = db_path
@@ -25,8 +142,19 @@ class BitcoinTextToSQL:
         if self.openai_api_key:
             openai.api_key = self.openai_api_key
         
-        # Database schema information for context
-        self.schema_info = self._get_schema_info()
+        # Shared connection, opened on first use and kept for the converter's lifetime
+        self._conn = None
+        
+        # (sql, data_version) -> (results, columns) for repeated queries
+        self._result_cache: Dict[Tuple[str, int], Tuple[List[Dict], List[str]]] = {}
+        self._result_cache_lock = threading.Lock()
+        
+        # Guards the generated-SQL cache (_sql_cache), which is loaded on first use
+        self._sql_cache_lock = threading.Lock()
+        
+        # Database mtime the schema was last read at, and when that was checked
+        self._db_mtime: Optional[float] = None
+        self._schema_checked_at = 0.0
         
         # Common Bitcoin terms and their SQL mappings
         self.term_mappings = {
@@ -51,11 +179,89 @@ class BitcoinTextToSQL:
             'date': 'blocks.time',
             'timestamp': 'blocks.time'
         }
+        # All terms as one whole-word alternation, longest first so 'timestamp'
+        # wins over 'time'; the question is rewritten in a single pass
+        self._term_re = re.compile(
+            r'\b(' + '|'.join(re.escape(term) for term in sorted(self.term_mappings, key=len, reverse=True)) + r')\b'
+        )
+    
+    def get_db_connection(self) -> sqlite3.Connection:
+        """Get the shared SQLite database connection"""
+        if self._conn is None:
+            # Shared across threads (the test runner executes cases concurrently);
+            # autocommit, since queries are read-only and need no implicit transaction
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, cached_statements=SQLITE_CACHED_STATEMENTS)
+            conn.row_factory = sqlite3.Row
+            conn.executescript(SQLITE_PRAGMAS)
+            self._conn = conn
+        return self._conn
+    
+    def close(self):
+        """Close the shared database connection"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    @functools.cached_property
+    def schema_info(self) -> str:
+        """Database schema information for context, read on first use"""
+        return self._get_schema_info()
+    
+    @functools.cached_property
+    def _schema_hash(self) -> str:
+        """Hash of the schema the SQL cache is valid for"""
+        return hashlib.blake2b(self.schema_info.encode(), digest_size=8).hexdigest()
+    
+    def _check_schema(self):
+        """Re-read the schema if the database changed, at most once per SCHEMA_RECHECK_INTERVAL"""
+        now = time.monotonic()
+        if now - self._schema_checked_at < SCHEMA_RECHECK_INTERVAL:
+            return
+        self._schema_checked_at = now
+        
+        try:
+            mtime = os.path.getmtime(self.db_path)
+        except OSError:
+            return
+        if mtime == self._db_mtime:
+            return
+        
+        # Data writes also bump the mtime; only a different schema hash
+        # invalidates the generated SQL
+        old_hash = self.__dict__.get('_schema_hash')
+        for name in ('schema_info', '_schema_hash', '_prompt_parts', '_batch_prompt_parts'):
+            self.__dict__.pop(name, None)
+        self._db_mtime = mtime
+        if old_hash is not None and self._schema_hash != old_hash:
+            with self._sql_cache_lock:
+                self.__dict__.pop('_sql_cache', None)
+    
+    @functools.cached_property
+    def _sql_cache(self) -> Dict[str, str]:
+        """Generated SQL keyed by question, for the current schema"""
+        return self._load_sql_cache()
     
     def _get_schema_info(self) -> str:
         """Get database schema information for context"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            # Keyed on the file's mtime so converters for one database share the result
+            return self._read_schema_info(os.path.abspath(self.db_path), os.path.getmtime(self.db_path))
+        except Exception as e:
+            logger.error(f"Failed to get schema info: {e}")
+            return "Database schema information unavailable"
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def _read_schema_info(db_path: str, mtime: float) -> str:
+        """Read table and column names from the database"""
+        conn = sqlite3.connect(f"file:{quote(db_path)}?mode=ro", uri=True)
+        try:
             cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
             tables = [row[0] for row in cursor.fetchall()]
             
@@ -67,64 +273,114 @@ class BitcoinTextToSQL:
                 for col in columns:
                     schema_info += f"  - {col[1]} ({col[2]})\n"
             
-            conn.close()
             return schema_info
-        except Exception as e:
-            logger.error(f"Failed to get schema info: {e}")
-            return "Database schema information unavailable"
+        finally:
+            conn.close()
+    
+    def _load_sql_cache(self) -> Dict[str, str]:
+        """Load the persisted SQL cache, discarding it if the schema has changed"""
+        try:
+            with open(SQL_CACHE_PATH, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        
+        if data.get('schema_hash') != self._schema_hash:
+            logger.info("Database schema changed; discarding cached SQL")
+            return {}
+        return data.get('entries', {})
+    
+    def _save_sql_cache(self):
+        """Write the SQL cache to disk (callers hold _sql_cache_lock)"""
+        try:
+            os.makedirs(os.path.dirname(SQL_CACHE_PATH), exist_ok=True)
+            tmp_path = f"{SQL_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'schema_hash': self._schema_hash, 'entries': self._sql_cache}, f)
+            os.replace(tmp_path, SQL_CACHE_PATH)
+        except OSError as e:
+            logger.warning(f"Failed to save SQL cache: {e}")
+    
+    def invalidate_cache(self):
+        """Drop all cached OpenAI-generated SQL"""
+        with self._sql_cache_lock:
+            self._sql_cache = {}
+            self._save_sql_cache()
     
     def _preprocess_question(self, question: str) -> str:
         """Preprocess the natural language question"""
-        # Convert to lowercase for better matching
-        question = question.lower()
-        
-        # Replace common Bitcoin terms with their SQL equivalents
-        for term, sql_term in self.term_mappings.items():
-            if term in question:
-                question = question.replace(term, sql_term)
-        
-        return question
+        # Convert to lowercase for better matching, then replace common Bitcoin
+        # terms with their SQL equivalents. Replacements are not rescanned.
+        return self._term_re.sub(lambda match: self.term_mappings[match.group(1)], question.lower())
     
-    def _generate_sql_with_openai(self, question: str) -> str:
-        """Generate SQL using OpenAI API"""
-        if not self.openai_api_key:
-            raise Exception("OpenAI API key not available")
-        
-        prompt = f"""
+    @functools.cached_property
+    def _prompt_parts(self) -> Tuple[str, str]:
+        """Single-question prompt with the schema filled in, split where the question goes"""
+        prefix = f"""
 You are a SQL expert for Bitcoin blockchain data. Convert the following natural language question to SQL.
 
 Database Schema:
 {self.schema_info}
 
-Important Notes:
-- Use SQLite syntax
-- Bitcoin amounts are stored in BTC (not satoshis)
-- Timestamps are Unix timestamps
-- Addresses are stored as JSON arrays in scriptPubKey_addresses
-- Use proper JOINs when querying across tables
-- Always use LIMIT for large result sets
+{SQL_PROMPT_NOTES}
 
-Question: {question}
+Question: """
+        suffix = """
 
 Generate only the SQL query, no explanations:
 """
+        return prefix, suffix
+    
+    @functools.cached_property
+    def _batch_prompt_parts(self) -> Tuple[str, str]:
+        """Batch prompt with the schema filled in, split where the numbered questions go"""
+        prefix = f"""
+You are a SQL expert for Bitcoin blockchain data. Convert each of the following numbered natural language questions to SQL.
+
+Database Schema:
+{self.schema_info}
+
+{SQL_PROMPT_NOTES}
+
+Questions:
+"""
+        suffix = """
+
+Respond with a JSON object of the form {"queries": ["<SQL for question 1>", "<SQL for question 2>", ...]}, one SQL query per question, in order, no explanations.
+"""
+        return prefix, suffix
+    
+    def _generate_sql_with_openai(self, question: str) -> str:
+        """Generate SQL using OpenAI API"""
+        if not self.openai_api_key:
+            raise Exception("OpenAI API key not available")
+        
+        # Same question against the same schema: reuse the earlier answer
+        self._check_schema()
+        cache_key = question.strip()
+        cached_sql = self._sql_cache.get(cache_key)
+        if cached_sql is not None:
+            return cached_sql
+        
+        prefix, suffix = self._prompt_parts
+        prompt = prefix + question + suffix
         
         try:
             response = openai.ChatCompletion.create(
                 model="gpt-3.5-turbo",
                 messages=[
-                    {"role": "system", "content": "You are a SQL expert. Generate only SQL queries, no explanations."},
+                    SYSTEM_MESSAGE,
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=500,
                 temperature=0.1
             )
             
-            sql = response.choices[0].message.content.strip()
+            sql = self._sql_from_response(response)
             
-            # Clean up the SQL
-            sql = re.sub(r'```sql\s*', '', sql)
-            sql = re.sub(r'\s*```', '', sql)
+            with self._sql_cache_lock:
+                self._sql_cache[cache_key] = sql
+                self._save_sql_cache()
             
             return sql
             
@@ -132,37 +388,155 @@ Generate only the SQL query, no explanations:
             logger.error(f"OpenAI API call failed: {e}")
             raise
     
-    def _generate_sql_rule_based(self, question: str) -> str:
-        """Generate SQL using rule-based approach"""
-        question = question.lower()
+    async def _generate_sql_with_openai_async(self, question: str, semaphore: asyncio.Semaphore) -> str:
+        """Generate SQL using the OpenAI API without blocking the event loop"""
+        # Same question against the same schema: reuse the earlier answer
+        cache_key = question.strip()
+        cached_sql = self._sql_cache.get(cache_key)
+        if cached_sql is not None:
+            return cached_sql
+        
+        prefix, suffix = self._prompt_parts
+        prompt = prefix + question + suffix
+        
+        try:
+            async with semaphore:
+                response = await openai.ChatCompletion.acreate(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        SYSTEM_MESSAGE,
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=500,
+                    temperature=0.1
+                )
+            
+            sql = self._sql_from_response(response)
+            
+            with self._sql_cache_lock:
+                self._sql_cache[cache_key] = sql
+                self._save_sql_cache()
+            
+            return sql
+            
+        except Exception as e:
+            logger.error(f"OpenAI API call failed: {e}")
+            raise
+    
+    @staticmethod
+    def _sql_from_response(response) -> str:
+        """Extract the SQL from a chat completion, without markdown fences"""
+        sql = response.choices[0].message.content.strip()
+        
+        # Clean up the SQL
+        sql = SQL_FENCE_OPEN_RE.sub('', sql)
+        sql = SQL_FENCE_CLOSE_RE.sub('', sql)
+        return sql
+    
+    def _generate_sql_batch_with_openai(self, questions: List[str]) -> List[str]:
+        """Generate SQL for several questions in one OpenAI request"""
+        numbered = "\n".join(f"{i}. {question.strip()}" for i, question in enumerate(questions, 1))
+        prefix, suffix = self._batch_prompt_parts
+        prompt = prefix + numbered + suffix
+        
+        try:
+            response = openai.ChatCompletion.create(
+                model=BATCH_MODEL,
+                messages=[
+                    SYSTEM_MESSAGE,
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=500 * len(questions),
+                temperature=0.1
+            )
+            
+            queries = json.loads(response.choices[0].message.content)['queries']
+            if not isinstance(queries, list) or len(queries) != len(questions):
+                raise ValueError(f"expected {len(questions)} queries, got {len(queries) if isinstance(queries, list) else type(queries).__name__}")
+            
+            return [str(sql).strip() for sql in queries]
+            
+        except Exception as e:
+            logger.error(f"Batch OpenAI API call failed: {e}")
+            raise
+    
+    def convert_batch(self, questions: List[str], use_openai: bool = True) -> List[str]:
+        """Convert several natural language questions to SQL, with one OpenAI request for all uncached ones"""
+        if not (use_openai and self.openai_api_key):
+            return [self.convert_to_sql(question, use_openai=False) for question in questions]
         
-        # Simple pattern matching for common questions
-        if 'total' in question and 'blocks' in question:
-            return "SELECT COUNT(*) as total_blocks FROM blocks"
+        # Only questions not answered before, or by a rule, go into the request
+        self._check_schema()
+        pending = list(dict.fromkeys(
+            question.strip() for question in questions
+            if question.strip() not in self._sql_cache and self._match_rule(question) is None
+        ))
+        if pending:
+            try:
+                generated = self._generate_sql_batch_with_openai(pending)
+            except Exception:
+                # Fall back to one request per question, sent concurrently
+                return asyncio.run(self.convert_batch_async(questions))
+            
+            with self._sql_cache_lock:
+                self._sql_cache.update(zip(pending, generated))
+                self._save_sql_cache()
         
-        elif 'latest' in question and 'block' in question:
-            return "SELECT * FROM blocks ORDER BY height DESC LIMIT 1"
+        return [self._match_rule(question) or self._sql_cache[question.strip()] for question in questions]
+    
+    async def convert_batch_async(self, questions: List[str], use_openai: bool = True) -> List[str]:
+        """Convert several natural language questions to SQL with concurrent OpenAI requests"""
+        if not (use_openai and self.openai_api_key):
+            return [self.convert_to_sql(question, use_openai=False) for question in questions]
         
-        elif 'transaction' in question and 'count' in question:
-            return "SELECT COUNT(*) as total_transactions FROM transactions"
+        self._check_schema()
+        semaphore = asyncio.Semaphore(OPENAI_CONCURRENCY)
         
-        elif 'difficulty' in question and 'current' in question:
-            return "SELECT difficulty FROM blocks ORDER BY height DESC LIMIT 1"
+        async def convert(question: str) -> str:
+            try:
+                rule_sql = self._match_rule(question)
+                if rule_sql is not None:
+                    return rule_sql
+                return await self._generate_sql_with_openai_async(question, semaphore)
+            except Exception as e:
+                logger.error(f"Failed to convert question to SQL: {e}")
+                return f"SELECT 'Error: {str(e)}' as error"
         
-        elif 'block' in question and 'size' in question and 'average' in question:
-            return "SELECT AVG(size) as avg_block_size FROM blocks"
+        return list(await asyncio.gather(*(convert(question) for question in questions)))
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def _match_rule(question: str) -> Optional[str]:
+        """Return the SQL for a question matching a high-confidence rule, or None"""
+        question = ' '.join(question.lower().split())
+        for pattern, sql in RULE_BASED_EXACT:
+            if pattern.match(question):
+                return sql
+        return None
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def _generate_sql_rule_based(question: str) -> str:
+        """Generate SQL using rule-based approach (deterministic, so memoized)"""
+        question = question.lower()
         
-        elif 'address' in question and 'balance' in question:
-            # This is complex - would need more context
-            return "SELECT 'Complex query - address balance requires specific address' as note"
+        # Simple pattern matching for common questions; first matching rule wins
+        for pattern, sql in RULE_BASED_RULES:
+            if pattern.match(question):
+                return sql
         
-        else:
-            # Default fallback
-            return "SELECT 'Unable to generate SQL for this question' as error"
+        # Default fallback
+        return RULE_BASED_FALLBACK
     
     def convert_to_sql(self, question: str, use_openai: bool = True) -> str:
         """Convert natural language question to SQL"""
         try:
+            # Questions a high-confidence rule answers need no OpenAI round trip
+            rule_sql = self._match_rule(question)
+            if rule_sql is not None:
+                return rule_sql
+            
             if use_openai and self.openai_api_key:
                 return self._generate_sql_with_openai(question)
             else:
@@ -171,33 +545,106 @@ Generate only the SQL query, no explanations:
             logger.error(f"Failed to convert question to SQL: {e}")
             return f"SELECT 'Error: {str(e)}' as error"
     
-    def execute_sql(self, sql: str) -> Tuple[List[Dict], List[str]]:
-        """Execute SQL query and return results"""
+    def _open_cursor(self, sql: str) -> Tuple[sqlite3.Cursor, List[str]]:
+        """Execute SQL and return the cursor and its column names"""
+        conn = self.get_db_connection()
+        
+        cursor = conn.execute(sql)
+        
+        # Get column names
+        columns = [description[0] for description in cursor.description]
+        return cursor, columns
+    
+    @staticmethod
+    def _preview_sql(sql: str, preview: Optional[int]) -> str:
+        """Limit a query to preview + 1 rows, so callers can tell there were more"""
+        if preview is None:
+            return sql
+        query = sql.strip().rstrip(';')
+        bare = SQL_QUOTED_RE.sub(' ', query)
+        # A semicolon left over means a trailing comment or a second statement,
+        # which cannot go inside a subquery
+        if not SELECT_RE.match(query) or ';' in bare or OUTER_LIMIT_RE.search(bare):
+            return sql
+        # The closing parenthesis goes on its own line, so a trailing -- comment
+        # in the query cannot swallow it
+        return f"SELECT * FROM (\n{query}\n) LIMIT {preview + 1}"
+    
+    def iter_sql(self, sql: str, preview: Optional[int] = None) -> Tuple[Iterator[Dict], List[str]]:
+        """Execute SQL query and return a lazy iterator over its results"""
+        sql = self._preview_sql(sql, preview)
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            
-            cursor = conn.execute(sql)
-            
-            # Get column names
-            columns = [description[0] for description in cursor.description]
-            
-            # Get results
-            results = []
-            for row in cursor.fetchall():
-                result = {}
-                for i, col in enumerate(columns):
+            cursor, columns = self._open_cursor(sql)
+        except Exception as e:
+            logger.error(f"SQL execution failed: {e}")
+            return iter(()), [f"Error: {str(e)}"]
+        
+        return self._iter_rows(cursor, columns), columns
+    
+    def _iter_rows(self, cursor: sqlite3.Cursor, columns: List[str]) -> Iterator[Dict]:
+        """Yield result rows as dicts, fetching them from SQLite in batches"""
+        # Where each result key comes from; with duplicate column names the last
+        # one wins, as in dict(zip(...)). Timestamp columns are known from the
+        # names, so they are found once per query.
+        column_idx = {col: i for i, col in enumerate(columns)}
+        ts_idx = [(col, i) for col, i in column_idx.items() if col in TIMESTAMP_COLUMNS]
+        # Blob columns likewise, from the names plus any aliased or computed
+        # column that is bytes (or NULL, so still undecided) in the first row
+        blob_idx: Optional[List[Tuple[str, int]]] = None
+        
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            if blob_idx is None:
+                first = rows[0]
+                blob_idx = [(col, i) for col, i in column_idx.items() if col in BLOB_COLUMNS or isinstance(first[i], (bytes, type(None)))]
+            for row in rows:
+                result = dict(zip(columns, row))
+                # Hash columns are raw bytes; present them as hex
+                for col, i in blob_idx:
                     value = row[i]
-                    # Convert datetime if it's a timestamp
-                    if isinstance(value, int) and col in ['time', 'block_time', 'created_at']:
+                    if isinstance(value, bytes):
+                        if col == 'txinwitness':
+                            result[col] = json.loads(zlib.decompress(value))
+                        else:
+                            result[col] = value.hex()
+                # Convert datetime if it's a timestamp
+                for col, i in ts_idx:
+                    value = row[i]
+                    if isinstance(value, int):
                         try:
-                            value = datetime.fromtimestamp(value).isoformat()
+                            result[col] = time.strftime(TIMESTAMP_FORMAT, time.gmtime(value))
                         except:
                             pass
-                    result[col] = value
-                results.append(result)
+                yield result
+    
+    def execute_sql(self, sql: str, preview: Optional[int] = None) -> Tuple[List[Dict], List[str]]:
+        """Execute SQL query and return results (cached for repeated identical queries)"""
+        cacheable = CACHEABLE_SQL_RE.match(sql) is not None and VOLATILE_SQL_RE.search(sql) is None
+        sql = self._preview_sql(sql, preview)
+        try:
+            if cacheable:
+                # data_version changes whenever another connection (the ETL) commits, so a
+                # cached result is reused only while the database is unchanged
+                data_version = self.get_db_connection().execute("PRAGMA data_version").fetchone()[0]
+                key = (sql, data_version)
+                # Callers get their own copies of cached rows, so one that edits a
+                # result cannot change what later identical queries see
+                cached = self._result_cache.get(key)
+                if cached is not None:
+                    cached_results, cached_columns = cached
+                    return [dict(row) for row in cached_results], list(cached_columns)
+            
+            cursor, columns = self._open_cursor(sql)
+            results = list(self._iter_rows(cursor, columns))
+            
+            if cacheable and len(results) <= RESULT_CACHE_MAX_ROWS:
+                with self._result_cache_lock:
+                    if len(self._result_cache) >= RESULT_CACHE_SIZE:
+                        self._result_cache.pop(next(iter(self._result_cache)))
+                    self._result_cache[key] = ([dict(row) for row in results], list(columns))
             
-            conn.close()
             return results, columns
             
         except Exception as e:
@@ -255,28 +702,27 @@ def main():
     DB_PATH = "../data/btc.db"
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     
-    # Initialize converter
-    converter = BitcoinTextToSQL(DB_PATH, OPENAI_API_KEY)
-    
-    # Test with sample questions
-    sample_questions = converter.get_sample_questions()
-    
-    print("Bitcoin Text-to-SQL Converter")
-    print("=" * 50)
-    
-    for question in sample_questions[:3]:  # Test first 3 questions
-        print(f"\nQuestion: {question}")
-        print("-" * 30)
+    # Initialize converter; the context manager closes its database connection
+    with BitcoinTextToSQL(DB_PATH, OPENAI_API_KEY) as converter:
+        # Test with sample questions
+        sample_questions = converter.get_sample_questions()
         
-        result = converter.query_bitcoin_data(question, use_openai=bool(OPENAI_API_KEY))
+        print("Bitcoin Text-to-SQL Converter")
+        print("=" * 50)
         
-        print(f"SQL: {result['sql']}")
-        print(f"Results: {result['row_count']} rows")
-        
-        if result['results']:
-            print("Sample data:")
-            for i, row in enumerate(result['results'][:3]):  # Show first 3 rows
-                print(f"  Row {i+1}: {dict(row)}")
+        for question in sample_questions[:3]:  # Test first 3 questions
+            print(f"\nQuestion: {question}")
+            print("-" * 30)
+            
+            result = converter.query_bitcoin_data(question, use_openai=bool(OPENAI_API_KEY))
+            
+            print(f"SQL: {result['sql']}")
+            print(f"Results: {result['row_count']} rows")
+            
+            if result['results']:
+                print("Sample data:")
+                for i, row in enumerate(result['results'][:3]):  # Show first 3 rows
+                    print(f"  Row {i+1}: {dict(row)}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file